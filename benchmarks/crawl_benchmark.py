@@ -0,0 +1,108 @@
+''' Crawls a recorded corpus end to end, Crawler, workers, scraper and
+Frontier against a replay cache server, and prints the pages per second, the
+latency of every stage and the peak memory.
+
+Run from the project root with: python -m benchmarks.crawl_benchmark
+Without --corpus a synthetic corpus is generated first. Config values are
+overridden with --set SECTION:KEY=VALUE, for example
+--set "LOCAL PROPERTIES:ENGINE=asyncio". Politeness is 0 unless overridden. '''
+import os
+import json
+import time
+import logging
+import resource
+import tempfile
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+from utils.config import Config
+from utils.metrics import metrics
+from utils.replay import Corpus, generate_corpus, start_replay_server, stop_replay_server
+from crawler import Crawler
+
+def percentile(histogram, fraction):
+    # Upper bound of the bucket the value at fraction falls in.
+    rank = fraction * histogram["count"]
+    for bound, count in histogram["buckets"]:
+        if count >= rank:
+            return float(bound)
+    return float("inf")
+
+def crawl(config_file, corpus_file, seed_urls, overrides):
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    cparser["CRAWLER"]["POLITENESS"] = "0"
+    if seed_urls:
+        cparser["CRAWLER"]["SEEDURL"] = ",".join(seed_urls)
+    for override in overrides:
+        section, _, assignment = override.partition(":")
+        key, _, value = assignment.partition("=")
+        cparser[section][key] = value
+    config = Config(cparser)
+    server, config.cache_server = start_replay_server(corpus_file)
+    cwd = os.getcwd()
+    try:
+        # Save, log and report files go to a scratch directory.
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            start = time.perf_counter()
+            Crawler(config, True).start()
+            return time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+        stop_replay_server(server)
+
+def main(args):
+    logging.disable(logging.INFO)
+    seed_urls = None
+    corpus_file = args.corpus
+    if corpus_file is None:
+        corpus_file = os.path.join(tempfile.gettempdir(), "crawl_benchmark_corpus.bin")
+        seed_urls = generate_corpus(corpus_file, pages=args.pages, hosts=args.hosts)
+    corpus_size = len(Corpus(corpus_file))
+    elapsed = crawl(args.config_file, os.path.abspath(corpus_file), seed_urls, args.set)
+
+    snapshot = metrics.snapshot()
+    pages = snapshot["histograms"].get("frontier_complete_seconds", {"count": 0})["count"]
+    result = {
+        "corpus_urls": corpus_size,
+        "pages": pages,
+        "seconds": elapsed,
+        "pages_per_second": pages / elapsed,
+        # ru_maxrss is in KiB on Linux.
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_child_rss_mib": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        "stages": {
+            name[:-len("_seconds")]: {
+                "count": histogram["count"],
+                "total_seconds": histogram["sum"],
+                "mean_ms": histogram["sum"] / histogram["count"] * 1000,
+                "p50_ms": percentile(histogram, 0.5) * 1000,
+                "p95_ms": percentile(histogram, 0.95) * 1000,
+            } for name, histogram in sorted(snapshot["histograms"].items())
+            if name.endswith("_seconds") and histogram["count"]},
+        "counters": snapshot["counters"],
+    }
+    if args.json:
+        print(json.dumps(result, indent=1))
+        return
+    print(f"corpus: {corpus_size} urls")
+    print(f"crawled {pages} pages in {elapsed:.2f} s: {result['pages_per_second']:.1f} pages/s")
+    print(f"peak rss: {result['peak_rss_mib']:.1f} MiB crawler, "
+          f"{result['peak_child_rss_mib']:.1f} MiB largest child process")
+    print(f"{'stage':<20}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'total s':>10}")
+    for stage, stats in result["stages"].items():
+        # Percentiles are bucket upper bounds.
+        print(f"{stage:<20}{stats['count']:>8}{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}"
+              f"{stats['p95_ms']:>10.2f}{stats['total_seconds']:>10.2f}")
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--corpus", type=str, default=None,
+                        help="corpus recorded with launch.py --record, crawled from the config's seeds")
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--hosts", type=int, default=16)
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--set", action="append", default=[], metavar="SECTION:KEY=VALUE")
+    parser.add_argument("--json", action="store_true")
+    main(parser.parse_args())
@@ -0,0 +1,48 @@
+''' Compares the numpy simhash engine against the pure python one.
+
+Run from the project root with: python -m benchmarks.simhash_benchmark '''
+import random
+import string
+import timeit
+from argparse import ArgumentParser
+
+import simhash_detection
+from simhash_detection import calculate_features, simhash_python, hamming_distance
+
+def make_page(word_count, vocabulary_size=5000, seed=0):
+    rng = random.Random(seed)
+    vocabulary = [
+        "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 12)))
+        for _ in range(vocabulary_size)]
+    # Zipf like word frequencies, like real page text.
+    weights = [1 / (rank + 1) for rank in range(vocabulary_size)]
+    return " ".join(rng.choices(vocabulary, weights, k=word_count))
+
+def time_call(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+def main(word_counts, repeat, version):
+    if simhash_detection.np is None:
+        print("numpy is not installed, only the python engine is available.")
+    for word_count in word_counts:
+        features = calculate_features(make_page(word_count))
+        python_time = time_call(lambda: simhash_python(features, version=version), repeat)
+        print(f"{word_count} words, {len(features)} features, hash version {version}")
+        print(f"  python: {python_time * 1000:.2f} ms")
+        if simhash_detection.np is not None:
+            numpy_simhash = lambda: simhash_detection.simhash_numpy(features, version)
+            assert numpy_simhash() == simhash_python(features, version=version)
+            numpy_time = time_call(numpy_simhash, repeat)
+            print(f"  numpy:  {numpy_time * 1000:.2f} ms ({python_time / numpy_time:.1f}x)")
+    rng = random.Random(1)
+    pairs = [(rng.getrandbits(64), rng.getrandbits(64)) for _ in range(100000)]
+    hamming_time = time_call(lambda: [hamming_distance(a, b) for a, b in pairs], repeat)
+    print(f"hamming_distance: {hamming_time / len(pairs) * 1e9:.0f} ns per pair")
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--words", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--version", type=int, choices=(1, 2), default=1)
+    args = parser.parse_args()
+    main(args.words, args.repeat, args.version)
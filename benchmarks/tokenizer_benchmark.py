@@ -0,0 +1,84 @@
+''' Compares the TokenCounter against the character by character tokenizer
+Report used to have, and against the dict loop of calculate_features, on
+pages of growing size. The counters are also fed the page in small chunks,
+the way StreamingPageParser feeds them text nodes.
+
+Run from the project root with: python -m benchmarks.tokenizer_benchmark '''
+import random
+import string
+import timeit
+from argparse import ArgumentParser
+
+from tokenizer import TOKEN_PATTERN, TokenCounter, count_tokens
+
+def legacy_word_counts(text):
+    # Report.tokenize and a counting loop, as they were before the TokenCounter.
+    tokens = []
+    word = ""
+    for char in text:
+        if 'a' <= char <= 'z' or 'A' <= char <= 'Z' or '0' <= char <= '9':
+            word += char.lower()
+        elif word:
+            tokens.append(word)
+            word = ''
+    if word:
+        tokens.append(word)
+    frequencies = {}
+    for token in tokens:
+        frequencies[token] = frequencies.get(token, 0) + 1
+    return frequencies
+
+def legacy_features(text):
+    # calculate_features before the TokenCounter.
+    weights = {}
+    for word in text.split():
+        weights[word] = weights.get(word, 0) + 1
+    return weights
+
+def make_page(word_count, vocabulary_size=5000, seed=0):
+    rng = random.Random(seed)
+    vocabulary = [
+        "".join(rng.choice(string.ascii_letters + string.digits) for _ in range(rng.randint(2, 12)))
+        for _ in range(vocabulary_size)]
+    weights = [1 / (rank + 1) for rank in range(vocabulary_size)]
+    separators = [" ", " ", " ", "\n", ", ", ". ", " - ", "'s "]
+    words = rng.choices(vocabulary, weights, k=word_count)
+    return "".join(word + rng.choice(separators) for word in words)
+
+def count_chunked(text, chunk_size, pattern=TOKEN_PATTERN, lower=True):
+    counter = TokenCounter(pattern, lower)
+    for start in range(0, len(text), chunk_size):
+        counter.feed(text[start:start + chunk_size])
+    return counter.close()
+
+def time_call(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+def main(word_counts, repeat, chunk_size):
+    for word_count in word_counts:
+        text = make_page(word_count)
+        assert count_tokens(text) == legacy_word_counts(text)
+        assert count_chunked(text, chunk_size) == legacy_word_counts(text)
+        assert count_tokens(text, None, False) == legacy_features(text)
+        assert count_chunked(text, chunk_size, None, False) == legacy_features(text)
+        legacy_time = time_call(lambda: legacy_word_counts(text), repeat)
+        counter_time = time_call(lambda: count_tokens(text), repeat)
+        chunked_time = time_call(lambda: count_chunked(text, chunk_size), repeat)
+        print(f"{word_count} words, {len(text) / 1024:.0f} KiB")
+        print(f"  report words, legacy:  {legacy_time * 1000:8.2f} ms")
+        print(f"  report words, counter: {counter_time * 1000:8.2f} ms ({legacy_time / counter_time:.1f}x)")
+        print(f"  report words, chunked: {chunked_time * 1000:8.2f} ms ({legacy_time / chunked_time:.1f}x)")
+        legacy_time = time_call(lambda: legacy_features(text), repeat)
+        counter_time = time_call(lambda: count_tokens(text, None, False), repeat)
+        chunked_time = time_call(lambda: count_chunked(text, chunk_size, None, False), repeat)
+        print(f"  features, legacy:      {legacy_time * 1000:8.2f} ms")
+        print(f"  features, counter:     {counter_time * 1000:8.2f} ms ({legacy_time / counter_time:.1f}x)")
+        print(f"  features, chunked:     {chunked_time * 1000:8.2f} ms ({legacy_time / chunked_time:.1f}x)")
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--words", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chunk_size", type=int, default=256)
+    args = parser.parse_args()
+    main(args.words, args.repeat, args.chunk_size)
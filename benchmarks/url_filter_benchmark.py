@@ -0,0 +1,94 @@
+''' Compares the UrlFilter against the original regex based is_valid.
+
+Run from the project root with: python -m benchmarks.url_filter_benchmark
+Urls are read from --urls (one per line) or from the "Downloaded <url>"
+lines of Logs/Worker.log. Without either, a synthetic corpus is used. '''
+import os
+import re
+import random
+import timeit
+from argparse import ArgumentParser
+from urllib.parse import urlparse
+
+from url_filter import UrlFilter
+
+def legacy_is_valid(url):
+    # is_valid as it was before the UrlFilter.
+    parsed = urlparse(url)
+    if parsed.scheme not in set(["http", "https"]):
+        return False
+    valid_domains = [
+        ".ics.uci.edu",
+        ".cs.uci.edu",
+        ".informatics.uci.edu",
+        ".stat.uci.edu"
+    ]
+    domain = parsed.netloc
+    if not any(domain.endswith(d) for d in valid_domains):
+        return False
+    return not re.match(
+        r".*\.(css|js|bmp|gif|jpe?g|ico"
+        + r"|png|tiff?|mid|mp2|mp3|mp4"
+        + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+        + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+        + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+        + r"|epub|dll|cnf|tgz|sha1"
+        + r"|thmx|mso|arff|rtf|jar|csv"
+        + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower())
+
+def load_urls(filename):
+    if filename:
+        with open(filename) as file:
+            return [line.strip() for line in file if line.strip()]
+    urls = []
+    if os.path.exists("Logs/Worker.log"):
+        with open("Logs/Worker.log") as file:
+            for line in file:
+                match = re.search(r"Downloaded (\S+),", line)
+                if match:
+                    urls.append(match.group(1))
+    return urls
+
+def synthetic_urls(count, seed=0):
+    rng = random.Random(seed)
+    hosts = ["www.ics.uci.edu", "www.cs.uci.edu", "vision.ics.uci.edu", "wics.ics.uci.edu",
+             "www.informatics.uci.edu", "www.stat.uci.edu", "www.uci.edu", "github.com"]
+    words = ["faculty", "research", "people", "events", "community", "news", "about",
+             "courses", "wiki", "doku.php", "page", "calendar"]
+    endings = ["", "/", ".html", ".php", ".pdf", ".jpg", ".css", "?id=3", "?do=edit&rev=1",
+               "/2019-05-12", "?tribe-bar-date=2020-01-01", "#top"]
+    urls = []
+    for _ in range(count):
+        path = "/".join(rng.choice(words) for _ in range(rng.randint(0, 5)))
+        urls.append(f"{rng.choice(['http', 'https'])}://{rng.choice(hosts)}/{path}{rng.choice(endings)}")
+    return urls
+
+def main(filename, count, repeat):
+    urls = load_urls(filename) or synthetic_urls(count)
+    # Links are found many times over a crawl, so the corpus is checked more
+    # than once per run.
+    corpus = urls * 3
+    rng = random.Random(1)
+    rng.shuffle(corpus)
+    no_traps = UrlFilter(trap_rules=[])
+    mismatches = [url for url in urls if no_traps.is_valid(url) != legacy_is_valid(url)]
+    print(f"{len(urls)} urls, {len(corpus)} checks, {len(mismatches)} mismatches without trap rules")
+    legacy_time = min(timeit.repeat(lambda: [legacy_is_valid(url) for url in corpus], number=1, repeat=repeat))
+    print(f"  legacy is_valid:       {legacy_time / len(corpus) * 1e6:.2f} us per url")
+    for name, make_filter in [("UrlFilter, no traps", lambda: UrlFilter(trap_rules=[])),
+                              ("UrlFilter, all traps", UrlFilter)]:
+        times = []
+        for _ in range(repeat):
+            # A fresh filter each time, so the memo starts cold.
+            url_filter = make_filter()
+            times.append(timeit.timeit(lambda: [url_filter.is_valid(url) for url in corpus], number=1))
+        print(f"  {name + ':':22} {min(times) / len(corpus) * 1e6:.2f} us per url "
+              f"({legacy_time / min(times):.1f}x)")
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=str, default=None)
+    parser.add_argument("--count", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.urls, args.count, args.repeat)
@@ -1,28 +1,95 @@
+from threading import RLock
+
 from utils import get_logger
+from utils.metrics import metrics, PROFILERS
+from utils.replay import CorpusWriter
+from utils import download
 from crawler.frontier import Frontier
 from crawler.worker import Worker
+from crawler.async_worker import AsyncWorker
+from crawler.control import reload_config
+import scraper
 
 class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
         self.config = config
         self.logger = get_logger("CRAWLER")
+        scraper.configure(config, restart)
+        if config.record_file:
+            download.recorder = CorpusWriter(config.record_file)
         self.frontier = frontier_factory(config, restart)
+        self.lock = RLock()
         self.workers = list()
         self.worker_factory = worker_factory
         self.all_done = False
+        self.profiler = None
 
     def start_async(self):
-        self.workers = [
-            self.worker_factory(worker_id, self.config, self.frontier)
-            for worker_id in range(self.config.threads_count)]
-        for worker in self.workers:
-            worker.start()
+        if self.config.profiler != "off":
+            # Before any worker thread starts, so all of them are profiled.
+            self.profiler = PROFILERS[self.config.profiler](self.config.profile_file)
+            self.profiler.start()
+        if self.config.metrics_file:
+            metrics.start_periodic_dump(self.config.metrics_interval, self.config.metrics_file)
+        # The report is written periodically and once more by join.
+        scraper.start_reporting(self.config.report_interval, self.config.report_file)
+        if self.config.engine == "asyncio":
+            # A single event loop drives every download.
+            self.workers = [AsyncWorker(0, self.config, self.frontier)]
+            self.workers[0].start()
+        else:
+            self.resize(self.config.threads_count)
+
+    def resize(self, count):
+        ''' Starts or stops workers until count of them are crawling. A
+        stopped worker finishes its current url first. '''
+        if self.config.engine == "asyncio":
+            self.logger.warning("The asyncio engine has a single worker, set CONCURRENCY instead.")
+            return
+        with self.lock:
+            active = [worker for worker in self.workers if not worker.stopping.is_set()]
+            self.config.threads_count = count
+            for worker in active[count:]:
+                worker.stop()
+            for _ in range(count - len(active)):
+                worker = self.worker_factory(len(self.workers), self.config, self.frontier)
+                worker.start()
+                self.workers.append(worker)
+            if active and count != len(active):
+                self.logger.info(f"Resized the worker pool from {len(active)} to {count}.")
+
+    def stop(self):
+        ''' Drains the crawl: no new url is handed out, the downloads in
+        progress complete, and join then saves everything for a resume. '''
+        self.logger.info("Draining, waiting for the downloads in progress.")
+        self.frontier.drain()
+
+    def reload(self, config):
+        ''' Applies the reloadable values of config to the running crawl. '''
+        if "threads_count" in reload_config(self.config, config, self.logger):
+            self.resize(self.config.threads_count)
 
     def start(self):
         self.start_async()
         self.join()
 
     def join(self):
-        for worker in self.workers:
-            worker.join()
+        # resize may start workers while the others are joined.
+        while True:
+            with self.lock:
+                workers = [worker for worker in self.workers if worker.is_alive()]
+            if not workers:
+                break
+            for worker in workers:
+                worker.join()
+        self.frontier.close()
+        scraper.stop_reporting(self.config.report_file)
+        scraper.shutdown()
+        if download.recorder is not None:
+            download.recorder.close()
+            download.recorder = None
+        if self.config.metrics_file:
+            metrics.stop_periodic_dump(self.config.metrics_file)
+        if self.profiler is not None:
+            self.profiler.stop()
         self.all_done = True
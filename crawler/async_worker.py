@@ -0,0 +1,85 @@
+import asyncio
+
+from threading import Thread
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED
+
+from utils.download import download_async, aiohttp
+from utils import get_logger
+import scraper
+
+class AsyncWorker(Thread):
+    ''' Runs the whole crawl on one asyncio event loop instead of one thread
+    per download. Up to config.concurrency downloads are in flight at once,
+    the frontier still decides which host may be fetched next, and pages are
+    scraped on a pool of config.threads_count threads. '''
+
+    def __init__(self, worker_id, config, frontier):
+        self.logger = get_logger(f"AsyncWorker-{worker_id}", "Worker")
+        self.config = config
+        self.frontier = frontier
+        super().__init__(daemon=True)
+
+    def run(self):
+        asyncio.run(self.crawl())
+
+    async def crawl(self):
+        loop = asyncio.get_running_loop()
+        self.scrape_pool = ThreadPoolExecutor(
+            max_workers=self.config.threads_count, thread_name_prefix="Scraper")
+        if aiohttp is None:
+            # Without aiohttp every download holds an executor thread.
+            loop.set_default_executor(ThreadPoolExecutor(
+                max_workers=self.config.concurrency, thread_name_prefix="Download"))
+            await self.crawl_with(None)
+        else:
+            async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(
+                    limit=self.config.concurrency)) as session:
+                await self.crawl_with(session)
+        self.scrape_pool.shutdown()
+        self.logger.info("Frontier is empty. Stopping Crawler.")
+
+    async def crawl_with(self, session):
+        in_flight = set()
+        while True:
+            while len(in_flight) < self.config.concurrency:
+                tbd_url_data = self.frontier.get_tbd_url(block=False)
+                if not tbd_url_data:
+                    break
+                in_flight.add(asyncio.ensure_future(self.process(*tbd_url_data, session)))
+            if not in_flight:
+                if self.frontier.is_finished():
+                    return
+                # Every queued host is still in its politeness delay, or the
+                # frontier is refilling its queues from disk.
+                await asyncio.sleep(self.frontier.next_ready_in() or 0.01)
+                continue
+            # Wake up when a download finishes or, if a slot is free, when
+            # the next host is ready. With every slot busy a ready host has
+            # to wait for a download anyway.
+            timeout = None
+            if len(in_flight) < self.config.concurrency:
+                timeout = self.frontier.next_ready_in()
+            done, in_flight = await asyncio.wait(
+                in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            for task in done:
+                if task.exception():
+                    self.logger.error(f"Failed to crawl a url: {task.exception()!r}")
+
+    async def process(self, tbd_url, depth, session):
+        loop = asyncio.get_running_loop()
+        try:
+            allowed = await loop.run_in_executor(
+                None, scraper.can_fetch_robot, tbd_url, self.config.robots_timeout)
+            if not allowed:
+                self.logger.info(f"Skipping {tbd_url}, disallowed by robots.txt.")
+                return
+            resp = await download_async(tbd_url, self.config, self.logger, session)
+            self.logger.info(
+                f"Downloaded {tbd_url}, status <{resp.status}>, "
+                f"using cache {self.config.cache_server}.")
+            scraped_urls = await loop.run_in_executor(
+                self.scrape_pool, scraper.scraper, tbd_url, resp)
+            for scraped_url in scraped_urls:
+                self.frontier.add_url(scraped_url, depth)
+        finally:
+            self.frontier.mark_url_complete(tbd_url)
@@ -0,0 +1,74 @@
+import signal
+
+from configparser import ConfigParser
+from queue import Queue
+from threading import Thread
+
+from utils import get_logger
+from utils.config import Config
+
+# Config values that are read again on every use, and so can change while
+# the crawl runs. THREADCOUNT resizes the worker pool.
+RELOADABLE = (
+    "time_delay", "robots_timeout", "connect_timeout", "read_timeout",
+    "download_retries", "download_backoff", "max_page_size", "concurrency",
+    "threads_count")
+
+def load_config(config_file):
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    return Config(cparser)
+
+def reload_config(config, new_config, logger):
+    ''' Copies the reloadable values of new_config into config, which the
+    crawler shares with its frontier and workers. Returns the names of the
+    values that changed. Other changes are logged and left alone. '''
+    changed = list()
+    for name, value in vars(new_config).items():
+        if getattr(config, name, None) == value:
+            continue
+        if name in RELOADABLE:
+            logger.info(f"Reloaded {name}: {getattr(config, name)} -> {value}.")
+            setattr(config, name, value)
+            changed.append(name)
+        elif name not in ("cache_server", "record_file"):
+            logger.warning(f"{name} changed, it only takes effect on restart.")
+    return changed
+
+class SignalControl(object):
+    ''' Turns SIGTERM and SIGINT into target.stop(), and SIGHUP into
+    target.reload(config) with config_file read again. The handlers only
+    queue the request and a control thread carries it out, so they never
+    take a lock the interrupted main thread may hold. A second SIGINT
+    raises KeyboardInterrupt as usual, for when draining takes too long. '''
+
+    def __init__(self, target, config_file):
+        self.target = target
+        self.config_file = config_file
+        self.logger = get_logger("CONTROL")
+        self.requests = Queue()
+
+    def install(self):
+        Thread(target=self._run, daemon=True).start()
+        signal.signal(signal.SIGTERM, self._handle)
+        signal.signal(signal.SIGINT, self._handle)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self._handle)
+
+    def _handle(self, signum, frame):
+        if signum == signal.SIGINT:
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+        self.requests.put(signum)
+
+    def _run(self):
+        while True:
+            signum = self.requests.get()
+            try:
+                if signum == getattr(signal, "SIGHUP", None):
+                    self.logger.info(f"Reloading {self.config_file}.")
+                    self.target.reload(load_config(self.config_file))
+                else:
+                    self.logger.info(f"Got {signal.Signals(signum).name}, draining the crawl.")
+                    self.target.stop()
+            except Exception as e:
+                self.logger.error(f"Failed to handle {signal.Signals(signum).name}: {e!r}")
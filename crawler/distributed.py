@@ -0,0 +1,285 @@
+import os
+import copy
+import time
+import signal
+
+from functools import partial
+from threading import Thread
+from queue import Queue
+from multiprocessing import get_context
+from multiprocessing.connection import wait
+from urllib.parse import urlparse
+from zlib import crc32
+
+from utils import get_logger, get_urlhash, normalize
+from crawler import Crawler
+from crawler.control import reload_config
+from crawler.frontier import Frontier
+from report import Report
+import scraper
+
+# Seconds between two flushes of the cross shard links and status updates.
+FORWARD_INTERVAL = 0.1
+
+def shard_of(url, shard_count):
+    ''' Shard that crawls url. All urls of a host go to the same shard, so
+    its politeness delay and robots.txt stay in one process. '''
+    return crc32(urlparse(url).netloc.encode("utf-8", "surrogatepass")) % shard_count
+
+def shard_file(filename, shard):
+    root, ext = os.path.splitext(filename)
+    return f"{root}.shard{shard}{ext}"
+
+def shard_config(config, shard):
+    ''' Copy of config with the files of one shard. '''
+    config = copy.copy(config)
+    config.save_file = shard_file(config.save_file, shard)
+    config.report_file = shard_file(config.report_file, shard)
+    config.profile_file = shard_file(config.profile_file, shard)
+    if config.metrics_file:
+        config.metrics_file = shard_file(config.metrics_file, shard)
+    if config.record_file:
+        config.record_file = shard_file(config.record_file, shard)
+    config.seed_urls = [
+        url for url in config.seed_urls if shard_of(url, config.shard_count) == shard]
+    return config
+
+class ShardFrontier(Frontier):
+    ''' Frontier of one shard. Urls of other shards are kept in an outbox
+    per shard, which ShardLink sends to the coordinator, and an empty
+    frontier waits for urls from other shards until the coordinator stops
+    the crawl. '''
+
+    def __init__(self, config, restart, shard):
+        self.shard = shard
+        self.shard_count = config.shard_count
+        self.outboxes = [list() for _ in range(self.shard_count)]
+        self.stopped = False
+        super().__init__(config, restart)
+
+    def add_url(self, url, depth):
+        shard = shard_of(url, self.shard_count)
+        if shard == self.shard:
+            return super().add_url(url, depth)
+        if depth > self.depth_alert:
+            return
+        url = normalize(url)
+        urlhash = get_urlhash(url)
+        with self.lock:
+            # Urls of other shards are never crawled here, so the seen
+            # filter can remember which ones were already forwarded.
+            if urlhash in self.seen:
+                return
+            self.seen.add(urlhash)
+            self.outboxes[shard].append((url, depth))
+
+    def take_outboxes(self):
+        with self.lock:
+            outboxes = [(shard, links) for shard, links in enumerate(self.outboxes) if links]
+            for shard, links in outboxes:
+                self.outboxes[shard] = list()
+        return outboxes
+
+    def is_idle(self):
+        ''' Nothing left to crawl or forward, until more urls arrive. '''
+        with self.lock:
+            return super().is_finished() and not any(self.outboxes)
+
+    def get_tbd_url(self, block=True, stop=None):
+        with self.has_work:
+            while True:
+                tbd_url_data = super().get_tbd_url(block, stop)
+                if (tbd_url_data or not block or self.stopped
+                        or (stop is not None and stop.is_set())):
+                    return tbd_url_data
+                # Another shard may still send urls. A draining shard waits
+                # too, its link adds them to the save until the coordinator
+                # stops the crawl.
+                self.has_work.wait(1)
+
+    def is_finished(self):
+        return self.stopped
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            self.has_work.notify_all()
+
+class ShardLink(Thread):
+    ''' Connects a shard to the coordinator: forwards the outboxes in
+    batches, adds the urls other shards found, reports whether the shard is
+    idle and how many batches it has added, and sends the shard's report
+    totals every report_interval. Drain and reload requests from the
+    coordinator go to the shard's crawler. '''
+
+    def __init__(self, crawler, conn, report_interval):
+        self.crawler = crawler
+        self.frontier = crawler.frontier
+        self.conn = conn
+        self.report_interval = report_interval
+        self.received = 0
+        super().__init__(daemon=True)
+
+    def run(self):
+        status = None
+        next_report = time.time() + self.report_interval
+        while True:
+            # At most a few batches at a time, so the outboxes keep moving.
+            for i in range(16):
+                if not self.conn.poll(0 if i else FORWARD_INTERVAL):
+                    break
+                message = self.conn.recv()
+                if message[0] == "stop":
+                    self.frontier.stop()
+                    return
+                if message[0] == "drain":
+                    # The shard reports itself idle once its downloads are
+                    # done, and the coordinator stops the crawl as usual.
+                    self.crawler.stop()
+                    continue
+                if message[0] == "reload":
+                    self.crawler.reload(shard_config(message[1], self.frontier.shard))
+                    continue
+                for url, depth in message[1]:
+                    Frontier.add_url(self.frontier, url, depth)
+                self.received += 1
+            for shard, links in self.frontier.take_outboxes():
+                self.conn.send(("links", shard, links))
+            # Links are sent before the status that counts them, and the
+            # pipe keeps them in order.
+            new_status = (self.frontier.is_idle(), self.received)
+            if new_status != status:
+                status = new_status
+                self.conn.send(("status",) + status)
+            if time.time() >= next_report:
+                next_report = time.time() + self.report_interval
+                self.conn.send(("report", scraper.report_instance.state()))
+
+def run_shard(config, restart, shard, conn):
+    ''' Entry point of a shard process. '''
+    # Ctrl-C and a hang up reach the whole process group, the coordinator
+    # turns them into drain and reload requests.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    config = shard_config(config, shard)
+    crawler = Crawler(config, restart, frontier_factory=partial(ShardFrontier, shard=shard))
+    link = ShardLink(crawler, conn, config.report_interval)
+    link.start()
+    crawler.start()
+    link.join()
+    conn.send(("report", scraper.report_instance.state()))
+    conn.send(("done",))
+    conn.close()
+
+class Coordinator(object):
+    ''' Runs the crawl in config.shard_count processes, each crawling the
+    hosts that hash to it with its own frontier, save file and politeness
+    state. Routes the links shards find for each other, writes report.txt
+    from the totals of every shard, and stops the shards once all of them
+    are idle with every forwarded batch added. '''
+
+    def __init__(self, config, restart):
+        self.config = config
+        self.restart = restart
+        self.logger = get_logger("COORDINATOR")
+        self.shard_count = config.shard_count
+        self.outboxes = list()
+
+    def start(self):
+        context = get_context("spawn")
+        conns = list()
+        processes = list()
+        self.outboxes = list()
+        for shard in range(self.shard_count):
+            conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=run_shard, args=(self.config, self.restart, shard, child_conn),
+                name=f"Shard-{shard}")
+            process.start()
+            child_conn.close()
+            conns.append(conn)
+            processes.append(process)
+            # Sending from a thread per shard keeps the loop in _route
+            # reading, so a shard blocked on a full pipe never deadlocks
+            # with a send to it.
+            outbox = Queue()
+            Thread(target=self._send, args=(conn, outbox), daemon=True).start()
+            self.outboxes.append(outbox)
+        self.logger.info(f"Started {self.shard_count} shards.")
+        self._route(conns)
+        for process in processes:
+            process.join()
+        self.logger.info("All shards are done.")
+
+    def stop(self):
+        ''' Drains every shard. The crawl then stops the way it does once
+        every shard is idle. '''
+        for outbox in self.outboxes:
+            outbox.put(("drain",))
+
+    def reload(self, config):
+        ''' Applies the reloadable values of config in every shard. '''
+        reload_config(self.config, config, self.logger)
+        for outbox in self.outboxes:
+            outbox.put(("reload", config))
+
+    def _send(self, conn, outbox):
+        while True:
+            message = outbox.get()
+            try:
+                conn.send(message)
+            except OSError:
+                return
+            if message[0] == "stop":
+                return
+
+    def _route(self, conns):
+        shards = {conn: shard for shard, conn in enumerate(conns)}
+        # Batches sent to each shard, and the last (idle, added batches)
+        # status of each shard, None once it has exited.
+        delivered = [0] * self.shard_count
+        statuses = [(False, 0)] * self.shard_count
+        reports = dict()
+        running = set(conns)
+        stopping = False
+        next_report = time.time() + self.config.report_interval
+        while running:
+            for conn in wait(list(running), FORWARD_INTERVAL):
+                shard = shards[conn]
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    if not stopping:
+                        self.logger.error(f"Shard {shard} exited before the crawl was done.")
+                    statuses[shard] = None
+                    running.discard(conn)
+                    continue
+                if message[0] == "links":
+                    target = message[1]
+                    if not stopping and statuses[target] is not None:
+                        self.outboxes[target].put(("links", message[2]))
+                        delivered[target] += 1
+                elif message[0] == "status":
+                    statuses[shard] = message[1:]
+                elif message[0] == "report":
+                    reports[shard] = message[1]
+                elif message[0] == "done":
+                    running.discard(conn)
+            if not stopping and all(
+                    status is None or (status[0] and status[1] == delivered[shard])
+                    for shard, status in enumerate(statuses)):
+                self.logger.info("Every shard is idle. Stopping the crawl.")
+                stopping = True
+                for outbox in self.outboxes:
+                    outbox.put(("stop",))
+            if time.time() >= next_report:
+                next_report = time.time() + self.config.report_interval
+                self._write_report(reports)
+        self._write_report(reports)
+
+    def _write_report(self, reports):
+        report = Report()
+        for state in reports.values():
+            report.merge(state)
+        report.generate_report(self.config.report_file)
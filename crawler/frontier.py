@@ -1,20 +1,60 @@
 import os
-import shelve
+import time
+import heapq
 
-from threading import Thread, RLock
+from threading import Thread, RLock, Condition
 from queue import Queue, Empty
 from urllib.parse import urlparse
 
 from utils import get_logger, get_urlhash, normalize
-from scraper import is_valid
+from utils.metrics import metrics
+from scraper import is_valid, crawl_delay
+from crawler.persistence import BatchedSave, SqliteSave
+from crawler.seen import SeenUrls
+from crawler.spill import SpillQueue
+from crawler.priority import IndexedHeap, SCORERS
 
 class Frontier(object):
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
         self.depth_alert = 5
-        
+
+        assert self.config.scorer in SCORERS, f"SCORER should be one of {', '.join(SCORERS)}"
+        self.scorer = SCORERS[self.config.scorer]
+
+        # Per host queues of urls, ordered by their score, with (depth,
+        # inlinks) as values. A host with urls is either waiting in
+        # ready_heap (keyed on the time it may next be fetched), in
+        # ready_hosts (keyed on the score of its best url) once that time has
+        # passed, or busy while one of its urls is being downloaded.
+        self.lock = RLock()
+        self.has_work = Condition(self.lock)
+        self.host_queues = dict()
+        self.ready_heap = list()
+        self.ready_hosts = IndexedHeap()
+        self.scheduled_hosts = set()
+        self.host_pages = dict()
+        self.busy_hosts = set()
+        self.next_allowed = dict()
+        self.in_progress = 0
+        # At most hot_window urls are queued in memory, the rest wait in the
+        # spill files or, after a resume, in the save file. The refill thread
+        # moves them back, a quarter of the window at a time, once the queues
+        # fall below half the window. Both are at least 1 for small windows.
+        self.queued = 0
+        self.hot_window = self.config.hot_window
+        self.refill_below = max(1, self.hot_window // 2)
+        self.refill_batch = max(1, self.hot_window // 4)
+        self.needs_refill = Condition(self.lock)
+        self.closed = False
+        self.draining = False
+        self.refilling = False
+        self.spill = SpillQueue(
+            f"{self.config.save_file}.spill", self.config.spill_buckets)
+        # Pages of pending urls from the save file still to be loaded.
+        self.pending_pages = None
+
         if not os.path.exists(self.config.save_file) and not restart:
             # Save file does not exist, but request to load save.
             self.logger.info(
@@ -26,58 +66,235 @@ class Frontier(object):
                 f"Found save file {self.config.save_file}, deleting it.")
             os.remove(self.config.save_file)
         # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
-        if restart:
-            for url in self.config.seed_urls:
-                self.add_url(url, 0)
-        else:
+        save_factory = SqliteSave if self.config.save_format == "sqlite" else BatchedSave
+        self.save = save_factory(
+            self.config.save_file, self.config.save_batch_size,
+            self.config.save_flush_interval, restart=restart)
+        self.seen = SeenUrls(
+            self.config.save_file, self.config.seen_capacity, restart=restart)
+        if not restart:
             # Set the frontier state with contents of save file.
             self._parse_save_file()
+        if restart or not len(self.save):
+            for url in self.config.seed_urls:
+                self.add_url(url, 0)
+        self.refill_thread = Thread(target=self._refill, daemon=True)
+        self.refill_thread.start()
 
     def _parse_save_file(self):
-        ''' This function can be overridden for alternate saving techniques. '''
+        ''' This function can be overridden for alternate saving techniques.
+        Pending urls are not read here but a page at a time by _load_pending,
+        whenever the queues run low. '''
         total_count = len(self.save)
-        tbd_count = 0
-        for urlhash, entry in self.save.items():
-            if len(entry) == 2:
-                url, completed = entry
-                depth = 0
-            else:
-                url, completed, depth = entry
-            if not completed and is_valid(url) and depth < self.depth_alert:
-                self.to_be_downloaded.append((url, depth))
-                tbd_count += 1
+        # The same pass rebuilds the seen filter if it was lost.
+        tbd_count, self.pending_pages = self.save.pending_urls(
+            self.config.resume_page_size, self.seen if self.seen.is_new else None)
+        self._load_pending()
         self.logger.info(
             f"Found {tbd_count} urls to be downloaded from {total_count} total urls discovered.")
-    
-    def get_tbd_url(self):
-        try:
-            return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
+
+    def _load_pending(self):
+        with self.lock:
+            self._add_pending_page(next(self.pending_pages, None))
+
+    def _add_pending_page(self, page):
+        if page is None:
+            self.pending_pages = None
+            return
+        # Saved depths are those add_url was given, so resumed urls are
+        # queued one deeper and cut off at the same depth as in add_url.
+        for url, depth in page:
+            if is_valid(url) and depth <= self.depth_alert:
+                self._enqueue(url, depth + 1)
+
+    def _enqueue(self, url, depth, inlinks=1):
+        host = urlparse(url).netloc
+        with self.lock:
+            queue = self.host_queues.get(host)
+            if queue is None or url not in queue:
+                if self.queued >= self.hot_window:
+                    self.spill.push(host, url, depth)
+                    metrics.count("urls_spilled")
+                    return
+                if queue is None:
+                    queue = self.host_queues[host] = IndexedHeap()
+                self.queued += 1
+            score = self.scorer(url, depth, inlinks, self.host_pages.get(host, 0))
+            queue.push(url, score, (depth, inlinks))
+            if host in self.ready_hosts and score < self.ready_hosts.priority(host):
+                self.ready_hosts.push(host, score)
+            self._schedule(host)
+
+    def _reprioritize(self, url, depth):
+        # Another page links to a url that is still queued in memory.
+        queue = self.host_queues.get(urlparse(url).netloc)
+        if queue is not None and url in queue:
+            queued_depth, inlinks = queue.value(url)
+            self._enqueue(url, min(depth, queued_depth), inlinks + 1)
+
+    def _schedule(self, host):
+        # Put the host back on the heap if it has work and is not already
+        # waiting there or being downloaded from.
+        if (host in self.scheduled_hosts or host in self.busy_hosts
+                or not self.host_queues.get(host)):
+            return
+        ready_time = self.next_allowed.get(host, 0)
+        heapq.heappush(self.ready_heap, (ready_time, host))
+        self.scheduled_hosts.add(host)
+        self.has_work.notify()
+
+    def _has_unloaded(self):
+        return self.refilling or self.pending_pages is not None or len(self.spill) > 0
+
+    def _refill(self):
+        while True:
+            with self.lock:
+                while not self.closed and not (
+                        self._has_unloaded() and self.queued < self.refill_below):
+                    self.needs_refill.wait()
+                if self.closed:
+                    return
+                pending_pages = self.pending_pages
+                self.refilling = True
+            # Read without holding the frontier lock.
+            if pending_pages is not None:
+                page = next(pending_pages, None)
+            else:
+                page = self.spill.pop_batch(self.refill_batch)
+            with self.lock:
+                if pending_pages is not None:
+                    self._add_pending_page(page)
+                else:
+                    for url, depth in page:
+                        self._enqueue(url, depth)
+                self.refilling = False
+                # Workers waiting for the end of the crawl have to look again.
+                self.has_work.notify_all()
+
+    def _promote_ready_hosts(self):
+        # Hosts whose politeness delay is over compete on their best url.
+        now = time.time()
+        while self.ready_heap and self.ready_heap[0][0] <= now:
+            ready_time, host = heapq.heappop(self.ready_heap)
+            url, score, (depth, inlinks) = self.host_queues[host].peek()
+            self.ready_hosts.push(
+                host, self.scorer(url, depth, inlinks, self.host_pages.get(host, 0)))
+
+    def get_tbd_url(self, block=True, stop=None):
+        ''' Blocks until some host is allowed to be fetched again, and
+        returns the best scored url of the best ready host. Returns None
+        only when nothing is queued and no download is in progress, or
+        straight away if block is False and no host is ready. Also returns
+        None once the frontier drains or the stop event is set, wake()
+        makes waiting callers look at it. '''
+        with metrics.timer("frontier_get"), self.has_work:
+            while True:
+                if self.draining or (stop is not None and stop.is_set()):
+                    return None
+                wait = self.next_ready_in()
+                if wait == 0:
+                    self._promote_ready_hosts()
+                    host, host_score, _ = self.ready_hosts.pop()
+                    self.scheduled_hosts.discard(host)
+                    queue = self.host_queues[host]
+                    url, score, (depth, inlinks) = queue.pop()
+                    tbd_url_data = (url, depth)
+                    self.queued -= 1
+                    if not queue:
+                        del self.host_queues[host]
+                    self.host_pages[host] = self.host_pages.get(host, 0) + 1
+                    self.busy_hosts.add(host)
+                    self.in_progress += 1
+                    if self.queued < self.refill_below and self._has_unloaded():
+                        self.needs_refill.notify()
+                    return tbd_url_data
+                if not block or (wait is None and not self.in_progress
+                                 and not self._has_unloaded()):
+                    return None
+                self.has_work.wait(wait)
+
+    def next_ready_in(self):
+        ''' Seconds until the next waiting host may be fetched, None if no
+        host is waiting. '''
+        with self.lock:
+            if self.ready_hosts:
+                return 0
+            if not self.ready_heap:
+                return None
+            return max(0, self.ready_heap[0][0] - time.time())
+
+    def is_finished(self):
+        with self.lock:
+            if self.draining:
+                return not self.in_progress
+            return (not self.ready_heap and not self.ready_hosts
+                    and not self.in_progress
+                    and not self._has_unloaded())
 
     def add_url(self, url, depth):
         if depth > self.depth_alert:
             return
         url = normalize(url)
         urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False, depth)
-            self.save.sync()
-            self.to_be_downloaded.append((url, depth +1))
-    
+        with metrics.timer("frontier_add"), self.lock:
+            if urlhash in self.seen:
+                metrics.count("urls_seen_again")
+                self._reprioritize(url, depth + 1)
+                return
+            # The seen file may miss the last urls before a crash, so a url
+            # it does not know is still checked against the save.
+            if urlhash not in self.save:
+                metrics.count("urls_discovered")
+                self.save[urlhash] = (url, False, depth)
+                self._enqueue(url, depth + 1)
+            self.seen.add(urlhash)
+
     def mark_url_complete(self, url):
         urlhash = get_urlhash(url)
-        entry = self.save.get(urlhash)
-        if entry:
-            if len(entry) == 2:
-                url, completed = entry
-                depth = 0 
-            elif len(entry) == 3:
-                url, completed, depth = entry
-            self.save[urlhash] = (url, True, depth)
-            self.save.sync()
-        else:
-            self.logger.error(
-                f"Completed url {url}, but have not seen it before.")
- 
\ No newline at end of file
+        with metrics.timer("frontier_complete"), self.lock:
+            entry = self.save.get(urlhash)
+            if entry:
+                if len(entry) == 2:
+                    url, completed = entry
+                    depth = 0
+                elif len(entry) == 3:
+                    url, completed, depth = entry
+                self.save[urlhash] = (url, True, depth)
+            else:
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
+            self._release(url)
+
+    def _release(self, url):
+        # The politeness delay starts once the download has finished, and is
+        # longer if the host asks for it in its robots.txt.
+        host = urlparse(url).netloc
+        delay = max(self.config.time_delay, crawl_delay(url) or 0)
+        self.in_progress -= 1
+        self.busy_hosts.discard(host)
+        self.next_allowed[host] = time.time() + delay
+        self._schedule(host)
+        if not self.in_progress:
+            # Idle workers may need to find out that the crawl is over.
+            self.has_work.notify_all()
+
+    def wake(self):
+        with self.lock:
+            self.has_work.notify_all()
+
+    def drain(self):
+        ''' Stops handing out urls. Downloads in progress still complete,
+        and the queued urls stay pending in the save file for a resume. '''
+        with self.lock:
+            self.draining = True
+            self.has_work.notify_all()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.needs_refill.notify_all()
+        # A refill may be reading the save or the spill right now.
+        self.refill_thread.join()
+        self.save.close()
+        self.seen.close()
+        self.spill.close()
@@ -0,0 +1,309 @@
+import os
+import pickle
+import shelve
+import sqlite3
+
+from threading import Thread, RLock, Event
+
+from utils.metrics import metrics
+
+class BatchedSave(object):
+    ''' Write-behind replacement for the frontier shelve.
+
+    Changes are kept in memory and appended to a journal next to the save
+    file. The journal is fsynced once per batch, when batch_size changes are
+    waiting or every flush_interval seconds, and is folded into the shelve
+    when it grows past compact_size, on close and on the next start. A crash
+    loses at most the changes of one flush window. '''
+
+    def __init__(self, save_file, batch_size=100, flush_interval=5.0,
+                 compact_size=10000, restart=False):
+        self.journal_file = f"{save_file}.journal"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compact_size = compact_size
+        self.lock = RLock()
+        # Entries that are in the journal but not yet in the shelve.
+        self.pending = dict()
+        self.unflushed = 0
+
+        # On restart always start from an empty save, whatever files the
+        # dbm backend put next to save_file.
+        self.save = shelve.open(save_file, flag="n" if restart else "c")
+        if restart and os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self._replay_journal()
+        self._compact()
+        self.journal = open(self.journal_file, "ab")
+
+        self.closed = Event()
+        self.flusher = Thread(target=self._flush_periodically, daemon=True)
+        self.flusher.start()
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, "rb") as journal:
+            while True:
+                try:
+                    urlhash, entry = pickle.load(journal)
+                except Exception:
+                    # Either the end of the journal, or a record that was
+                    # torn by a crash in the middle of a write.
+                    break
+                self.pending[urlhash] = entry
+
+    def _compact(self):
+        # The shelve is synced before the journal is truncated, so a crash
+        # in between only replays entries that are already saved.
+        if self.pending:
+            for urlhash, entry in self.pending.items():
+                self.save[urlhash] = entry
+            self.save.sync()
+            self.pending.clear()
+        open(self.journal_file, "wb").close()
+
+    def _flush_periodically(self):
+        while not self.closed.wait(self.flush_interval):
+            with self.lock:
+                if self.unflushed and not self.closed.is_set():
+                    self.flush()
+
+    def flush(self):
+        with metrics.timer("save_flush"), self.lock:
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            self.unflushed = 0
+            if len(self.pending) >= self.compact_size:
+                self.journal.close()
+                self._compact()
+                self.journal = open(self.journal_file, "ab")
+
+    def sync(self):
+        self.flush()
+
+    def close(self):
+        with self.lock:
+            if self.closed.is_set():
+                return
+            self.closed.set()
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            self.journal.close()
+            self._compact()
+            self.save.close()
+
+    def __setitem__(self, urlhash, entry):
+        with self.lock:
+            self.pending[urlhash] = entry
+            pickle.dump((urlhash, entry), self.journal)
+            self.unflushed += 1
+            if self.unflushed >= self.batch_size:
+                self.flush()
+
+    def __getitem__(self, urlhash):
+        with self.lock:
+            if urlhash in self.pending:
+                return self.pending[urlhash]
+            return self.save[urlhash]
+
+    def get(self, urlhash, default=None):
+        try:
+            return self[urlhash]
+        except KeyError:
+            return default
+
+    def __contains__(self, urlhash):
+        with self.lock:
+            return urlhash in self.pending or urlhash in self.save
+
+    def __len__(self):
+        with self.lock:
+            return len(self.save) + sum(
+                1 for urlhash in self.pending if urlhash not in self.save)
+
+    def _scan(self):
+        # Every (urlhash, entry), journal entries over shelve ones. The
+        # caller holds the lock for the whole scan.
+        for urlhash, entry in self.save.items():
+            yield urlhash, self.pending.get(urlhash, entry)
+        for urlhash, entry in list(self.pending.items()):
+            if urlhash not in self.save:
+                yield urlhash, entry
+
+    def items(self):
+        ''' Snapshot of every (urlhash, entry). '''
+        with self.lock:
+            return list(self._scan())
+
+    def keys(self):
+        with self.lock:
+            return [urlhash for urlhash, entry in self._scan()]
+
+    def pending_urls(self, page_size, seen=None):
+        ''' Count of the urls pending when this is called, and an iterator
+        of their (url, depth) in lists of at most page_size. The shelve has
+        no index, so this is one full scan for the pending urlhashes, which
+        also adds every urlhash to seen if it is given. Their entries are
+        then read a page at a time, and the lock is never held between two
+        pages, so workers can use the save while the frontier pages through
+        it. '''
+        urlhashes = list()
+        with self.lock:
+            for urlhash, entry in self._scan():
+                if seen is not None:
+                    seen.add(urlhash)
+                if not entry[1]:
+                    urlhashes.append(urlhash)
+        return len(urlhashes), self._pending_pages(urlhashes, page_size)
+
+    def _pending_pages(self, urlhashes, page_size):
+        for start in range(0, len(urlhashes), page_size):
+            page = []
+            with self.lock:
+                for urlhash in urlhashes[start:start + page_size]:
+                    entry = self[urlhash]
+                    if len(entry) == 2:
+                        (url, completed), depth = entry, 0
+                    else:
+                        url, completed, depth = entry
+                    # Urls completed since the scan are left out.
+                    if not completed:
+                        page.append((url, depth))
+            if page:
+                yield page
+
+class SqliteSave(object):
+    ''' Frontier save in SQLite, with pending and completed urls in separate
+    tables so that resuming only reads the pending ones, a page at a time.
+
+    Same interface as BatchedSave. Changes are grouped in one transaction
+    that is committed every batch_size changes or flush_interval seconds,
+    and the write ahead log keeps the file consistent if the crawler dies. '''
+
+    def __init__(self, save_file, batch_size=100, flush_interval=5.0, restart=False):
+        if restart:
+            for path in (save_file, f"{save_file}-wal", f"{save_file}-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = RLock()
+        self.unflushed = 0
+        self.db = sqlite3.connect(save_file, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        for table in ("pending", "completed"):
+            self.db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                f"id INTEGER PRIMARY KEY AUTOINCREMENT, urlhash TEXT UNIQUE NOT NULL, "
+                f"url TEXT NOT NULL, depth INTEGER NOT NULL)")
+        self.db.execute("BEGIN")
+
+        self.closed = Event()
+        self.flusher = Thread(target=self._flush_periodically, daemon=True)
+        self.flusher.start()
+
+    def _flush_periodically(self):
+        while not self.closed.wait(self.flush_interval):
+            with self.lock:
+                if self.unflushed and not self.closed.is_set():
+                    self.flush()
+
+    def flush(self):
+        with metrics.timer("save_flush"), self.lock:
+            self.db.execute("COMMIT")
+            self.db.execute("BEGIN")
+            self.unflushed = 0
+
+    def sync(self):
+        self.flush()
+
+    def close(self):
+        with self.lock:
+            if self.closed.is_set():
+                return
+            self.closed.set()
+            self.db.execute("COMMIT")
+            self.db.close()
+
+    def __setitem__(self, urlhash, entry):
+        url, completed, depth = entry
+        source, target = ("pending", "completed") if completed else ("completed", "pending")
+        with self.lock:
+            self.db.execute(f"DELETE FROM {source} WHERE urlhash = ?", (urlhash,))
+            self.db.execute(
+                f"INSERT OR REPLACE INTO {target} (urlhash, url, depth) VALUES (?, ?, ?)",
+                (urlhash, url, depth))
+            self.unflushed += 1
+            if self.unflushed >= self.batch_size:
+                self.flush()
+
+    def __getitem__(self, urlhash):
+        with self.lock:
+            for table, completed in (("pending", False), ("completed", True)):
+                row = self.db.execute(
+                    f"SELECT url, depth FROM {table} WHERE urlhash = ?", (urlhash,)).fetchone()
+                if row:
+                    return (row[0], completed, row[1])
+        raise KeyError(urlhash)
+
+    def get(self, urlhash, default=None):
+        try:
+            return self[urlhash]
+        except KeyError:
+            return default
+
+    def __contains__(self, urlhash):
+        return self.get(urlhash) is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute(
+                "SELECT (SELECT COUNT(*) FROM pending) + (SELECT COUNT(*) FROM completed)"
+            ).fetchone()[0]
+
+    # Paging is done on id, which AUTOINCREMENT never hands out twice.
+    def _rows(self, query, page_size, last_rowid=0):
+        while True:
+            with self.lock:
+                rows = self.db.execute(query, (last_rowid, page_size)).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            yield rows
+
+    def items(self):
+        for table, completed in (("pending", False), ("completed", True)):
+            for rows in self._rows(
+                    f"SELECT rowid, urlhash, url, depth FROM {table} "
+                    f"WHERE rowid > ? ORDER BY rowid LIMIT ?", 10000):
+                for rowid, urlhash, url, depth in rows:
+                    yield urlhash, (url, completed, depth)
+
+    def keys(self):
+        for table in ("pending", "completed"):
+            for rows in self._rows(
+                    f"SELECT rowid, urlhash FROM {table} "
+                    f"WHERE rowid > ? ORDER BY rowid LIMIT ?", 10000):
+                for rowid, urlhash in rows:
+                    yield urlhash
+
+    def pending_urls(self, page_size, seen=None):
+        ''' Count of the urls pending when this is called, and an iterator
+        of their (url, depth) in lists of at most page_size. Urls added
+        later are not included. If seen is given every urlhash is added to
+        it. '''
+        with self.lock:
+            count, last_rowid = self.db.execute(
+                "SELECT COUNT(*), MAX(rowid) FROM pending").fetchone()
+        if seen is not None:
+            for urlhash in self.keys():
+                seen.add(urlhash)
+        return count, self._pending_pages(last_rowid or 0, page_size)
+
+    def _pending_pages(self, last_rowid, page_size):
+        for rows in self._rows(
+                f"SELECT rowid, url, depth FROM pending "
+                f"WHERE rowid > ? AND rowid <= {last_rowid} ORDER BY rowid LIMIT ?", page_size):
+            yield [(url, depth) for rowid, url, depth in rows]
@@ -0,0 +1,126 @@
+import math
+
+from urllib.parse import urlparse
+
+class IndexedHeap(object):
+    ''' Min heap of keys with a priority and a value each, that can change
+    the priority of a key already in it. Keys with the same priority come
+    out in the order they were first pushed. '''
+
+    def __init__(self):
+        # Entries are [priority, sequence, key, value].
+        self.heap = list()
+        self.index = dict()
+        self.sequence = 0
+
+    def push(self, key, priority, value=None):
+        ''' Adds key, or moves it to its new priority if already there. '''
+        i = self.index.get(key)
+        if i is None:
+            self.heap.append([priority, self.sequence, key, value])
+            self.sequence += 1
+            i = len(self.heap) - 1
+            self.index[key] = i
+            self._sift_up(i)
+            return
+        entry = self.heap[i]
+        old_priority = entry[0]
+        entry[0], entry[3] = priority, value
+        if priority < old_priority:
+            self._sift_up(i)
+        elif old_priority < priority:
+            self._sift_down(i)
+
+    def pop(self):
+        ''' Removes and returns (key, priority, value) of the lowest
+        priority. '''
+        last = self.heap.pop()
+        if self.heap:
+            entry, self.heap[0] = self.heap[0], last
+            self.index[last[2]] = 0
+            self._sift_down(0)
+        else:
+            entry = last
+        del self.index[entry[2]]
+        return entry[2], entry[0], entry[3]
+
+    def peek(self):
+        priority, sequence, key, value = self.heap[0]
+        return key, priority, value
+
+    def priority(self, key):
+        return self.heap[self.index[key]][0]
+
+    def value(self, key):
+        return self.heap[self.index[key]][3]
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.heap)
+
+    def _less(self, i, j):
+        return self.heap[i][:2] < self.heap[j][:2]
+
+    def _swap(self, i, j):
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.index[heap[i][2]] = i
+        self.index[heap[j][2]] = j
+
+    def _sift_up(self, i):
+        while i:
+            parent = (i - 1) >> 1
+            if not self._less(i, parent):
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i):
+        size = len(self.heap)
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < size and self._less(child, smallest):
+                    smallest = child
+            if smallest == i:
+                return
+            self._swap(i, smallest)
+            i = smallest
+
+# Scorers take a url, its depth, the number of pages it was found on and the
+# number of pages already fetched from its host. Lower scores are crawled
+# first.
+
+def fifo_score(url, depth, inlinks, host_pages):
+    ''' Discovery order. '''
+    return 0
+
+def depth_score(url, depth, inlinks, host_pages):
+    ''' Breadth first. '''
+    return depth
+
+def host_balance_score(url, depth, inlinks, host_pages):
+    ''' Hosts that had the fewest pages fetched first, then breadth first. '''
+    return host_pages + depth / 10
+
+def inlinks_score(url, depth, inlinks, host_pages):
+    ''' Urls linked from the most pages first. '''
+    return -inlinks
+
+def value_score(url, depth, inlinks, host_pages):
+    ''' Guess at how much a page is worth: shallow, linked from several
+    pages, on a host that has not had much of the budget yet, and without
+    the long paths and query strings that traps are made of. '''
+    parsed = urlparse(url)
+    return (depth - math.log2(inlinks) + host_pages / 100
+            + parsed.path.count("/") / 4 + (1 if parsed.query else 0))
+
+SCORERS = {
+    "fifo": fifo_score,
+    "depth": depth_score,
+    "host_balance": host_balance_score,
+    "inlinks": inlinks_score,
+    "value": value_score,
+}
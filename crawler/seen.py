@@ -0,0 +1,122 @@
+import os
+import mmap
+import bisect
+import heapq
+
+from array import array
+from threading import RLock
+
+class SeenUrls(object):
+    ''' In memory answer to "has this url been discovered before".
+
+    Urls are kept as the first 8 bytes of their urlhash. A Bloom filter
+    answers most new urls without touching anything else, and the others
+    are looked up in a sorted array of prefixes plus a set of recent ones.
+    The sorted array lives in filename.seen and the Bloom filter in
+    filename.bloom, both memory mapped, so a restart loads them instead of
+    scanning the save file. The recent set is merged into the array once it
+    grows past an eighth of it. '''
+
+    hash_count = 7
+
+    def __init__(self, filename, capacity=10000000, restart=False):
+        self.prefix_file = f"{filename}.seen"
+        self.bloom_file = f"{filename}.bloom"
+        self.lock = RLock()
+        # 10 bits per url gives about 1% false positives with 7 hashes.
+        self.bloom_size = max(capacity * 10, 1 << 16) // 8 * 8
+        if restart:
+            for path in (self.prefix_file, self.bloom_file):
+                if os.path.exists(path):
+                    os.remove(path)
+        # True if there is no seen file yet and the caller has to add every
+        # url it already knows about.
+        self.is_new = not os.path.exists(self.prefix_file)
+        self.recent = set()
+        self._open_prefixes()
+        self._open_bloom()
+
+    @staticmethod
+    def key(urlhash):
+        return int(urlhash[:16], 16)
+
+    def _open_prefixes(self):
+        self.prefix_map = None
+        if os.path.exists(self.prefix_file) and os.path.getsize(self.prefix_file):
+            with open(self.prefix_file, "rb") as file:
+                self.prefix_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.prefixes = memoryview(self.prefix_map).cast("Q")
+        else:
+            self.prefixes = array("Q")
+
+    def _open_bloom(self):
+        size = self.bloom_size // 8
+        rebuild = not (os.path.exists(self.bloom_file)
+                       and os.path.getsize(self.bloom_file) == size)
+        if rebuild:
+            with open(self.bloom_file, "wb") as file:
+                file.truncate(size)
+        with open(self.bloom_file, "r+b") as file:
+            self.bloom = mmap.mmap(file.fileno(), size)
+        if rebuild:
+            for key in self.prefixes:
+                self._bloom_add(key)
+
+    def _bloom_positions(self, key):
+        # Double hashing, the key is already a uniform hash.
+        h1, h2 = key & 0xffffffff, (key >> 32) | 1
+        return [(h1 + i * h2) % self.bloom_size for i in range(self.hash_count)]
+
+    def _bloom_add(self, key):
+        for position in self._bloom_positions(key):
+            self.bloom[position >> 3] |= 1 << (position & 7)
+
+    def _bloom_has(self, key):
+        return all(self.bloom[position >> 3] & (1 << (position & 7))
+                   for position in self._bloom_positions(key))
+
+    def __contains__(self, urlhash):
+        key = self.key(urlhash)
+        with self.lock:
+            if not self._bloom_has(key):
+                return False
+            if key in self.recent:
+                return True
+            i = bisect.bisect_left(self.prefixes, key)
+            return i < len(self.prefixes) and self.prefixes[i] == key
+
+    def add(self, urlhash):
+        key = self.key(urlhash)
+        with self.lock:
+            self._bloom_add(key)
+            self.recent.add(key)
+            if len(self.recent) > max(1 << 16, len(self.prefixes) // 8):
+                self._merge()
+
+    def _merge(self):
+        merged = array("Q", heapq.merge(self.prefixes, sorted(self.recent)))
+        tmp_file = f"{self.prefix_file}.tmp"
+        with open(tmp_file, "wb") as file:
+            merged.tofile(file)
+        self._close_prefixes()
+        os.replace(tmp_file, self.prefix_file)
+        self._open_prefixes()
+        self.recent.clear()
+
+    def _close_prefixes(self):
+        if self.prefix_map is not None:
+            self.prefixes.release()
+            self.prefix_map.close()
+            self.prefix_map = None
+
+    def __len__(self):
+        with self.lock:
+            return len(self.prefixes) + len(self.recent)
+
+    def close(self):
+        with self.lock:
+            if self.recent:
+                self._merge()
+            self._close_prefixes()
+            self.bloom.flush()
+            self.bloom.close()
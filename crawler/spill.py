@@ -0,0 +1,90 @@
+import os
+import shutil
+import struct
+
+from threading import RLock
+from zlib import crc32
+
+RECORD_HEADER = struct.Struct("<IH")
+
+class SpillQueue(object):
+    ''' Overflow of the frontier queues, kept on disk.
+
+    (url, depth) records are appended to one segment file per host bucket,
+    each record a (length, depth) header followed by the utf-8 url. Buckets
+    are read back round robin, so refills mix hosts, and a bucket file is
+    truncated once it has been read to the end. Nothing here needs to
+    survive a restart: every spilled url is still pending in the save. '''
+
+    def __init__(self, directory, bucket_count=64, read_size=1 << 16):
+        self.directory = directory
+        self.bucket_count = bucket_count
+        self.read_size = read_size
+        self.lock = RLock()
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+        self.files = [
+            open(os.path.join(directory, f"bucket-{bucket}.seg"), "a+b")
+            for bucket in range(bucket_count)]
+        self.read_offsets = [0] * bucket_count
+        self.counts = [0] * bucket_count
+        self.next_bucket = 0
+        self.size = 0
+
+    def push(self, host, url, depth):
+        data = url.encode("utf-8", "surrogatepass")
+        bucket = crc32(host.encode("utf-8", "surrogatepass")) % self.bucket_count
+        with self.lock:
+            self.files[bucket].write(RECORD_HEADER.pack(len(data), depth) + data)
+            self.counts[bucket] += 1
+            self.size += 1
+
+    def pop_batch(self, max_count):
+        ''' Up to max_count (url, depth) records, taken from the buckets in
+        turn. '''
+        batch = []
+        with self.lock:
+            for _ in range(self.bucket_count):
+                if len(batch) >= max_count or not self.size:
+                    break
+                bucket = self.next_bucket
+                self.next_bucket = (bucket + 1) % self.bucket_count
+                if self.counts[bucket]:
+                    batch.extend(self._read(bucket, max_count - len(batch)))
+        return batch
+
+    def _read(self, bucket, max_count):
+        file = self.files[bucket]
+        file.flush()
+        file.seek(self.read_offsets[bucket])
+        data = file.read(self.read_size)
+        records = []
+        position = 0
+        while len(records) < max_count and position + RECORD_HEADER.size <= len(data):
+            length, depth = RECORD_HEADER.unpack_from(data, position)
+            end = position + RECORD_HEADER.size + length
+            if end > len(data):
+                if not records:
+                    # A url longer than read_size, read it whole.
+                    data += file.read(end - len(data))
+                    continue
+                break
+            records.append((data[position + RECORD_HEADER.size:end].decode("utf-8", "surrogatepass"), depth))
+            position = end
+        self.read_offsets[bucket] += position
+        self.counts[bucket] -= len(records)
+        self.size -= len(records)
+        if not self.counts[bucket]:
+            file.truncate(0)
+            self.read_offsets[bucket] = 0
+        return records
+
+    def __len__(self):
+        return self.size
+
+    def close(self):
+        with self.lock:
+            for file in self.files:
+                file.close()
+            shutil.rmtree(self.directory, ignore_errors=True)
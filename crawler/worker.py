@@ -1,16 +1,16 @@
-from threading import Thread
+from threading import Thread, Event
 
 from inspect import getsource
 from utils.download import download
 from utils import get_logger
 import scraper
-import time
 
 class Worker(Thread):
     def __init__(self, worker_id, config, frontier):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
         self.config = config
         self.frontier = frontier
+        self.stopping = Event()
         # basic check for requests in scraper
         assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
         assert {getsource(scraper).find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, "Do not use urllib.request in scraper.py"
@@ -18,18 +18,33 @@ class Worker(Thread):
         
     def run(self):
         while True:
-            tbd_url_data = self.frontier.get_tbd_url()
+            tbd_url_data = self.frontier.get_tbd_url(stop=self.stopping)
             if not tbd_url_data:
-                self.logger.info("Frontier is empty. Stopping Crawler.")
+                if self.stopping.is_set():
+                    self.logger.info("Worker stopped.")
+                elif self.frontier.draining:
+                    self.logger.info("Frontier is draining. Stopping Crawler.")
+                else:
+                    self.logger.info("Frontier is empty. Stopping Crawler.")
                 break
             tbd_url, depth = tbd_url_data
-            resp = download(tbd_url, self.config, self.logger)
-            self.logger.info(
-                f"Downloaded {tbd_url}, status <{resp.status}>, "
-                f"using cache {self.config.cache_server}.")
-            scraped_urls = scraper.scraper(tbd_url, resp)
-            for scraped_url in scraped_urls:
-                self.frontier.add_url(scraped_url)
-            self.frontier.mark_url_complete(tbd_url)
-            time.sleep(self.config.time_delay)
-            scraper.generate_current_report() # with insufficient time, tried to generate report after scraping each link to make sure that there is a report.
+            try:
+                if not scraper.can_fetch_robot(tbd_url, self.config.robots_timeout):
+                    self.logger.info(f"Skipping {tbd_url}, disallowed by robots.txt.")
+                    continue
+                resp = download(tbd_url, self.config, self.logger)
+                self.logger.info(
+                    f"Downloaded {tbd_url}, status <{resp.status}>, "
+                    f"using cache {self.config.cache_server}.")
+                scraped_urls = scraper.scraper(tbd_url, resp)
+                for scraped_url in scraped_urls:
+                    self.frontier.add_url(scraped_url, depth)
+            finally:
+                # The frontier holds the host until this is called, and
+                # applies the politeness delay from here on.
+                self.frontier.mark_url_complete(tbd_url)
+
+    def stop(self):
+        ''' Lets the worker exit once its current url is done. '''
+        self.stopping.set()
+        self.frontier.wake()
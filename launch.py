@@ -2,17 +2,35 @@ from configparser import ConfigParser
 from argparse import ArgumentParser
 
 from utils.server_registration import get_cache_server
+from utils.replay import start_replay_server, stop_replay_server
 from utils.config import Config
 from crawler import Crawler
+from crawler.control import SignalControl
+from crawler.distributed import Coordinator
 
 
-def main(config_file, restart):
+def main(config_file, restart, replay=None, record=None):
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
+    config.record_file = record
+    replay_server = None
+    if replay:
+        # Serve a recorded corpus instead of asking for a cache server.
+        replay_server, config.cache_server = start_replay_server(replay)
+    else:
+        config.cache_server = get_cache_server(config, restart)
+    if config.shard_count > 1:
+        # One crawler process per shard of the hosts.
+        crawler = Coordinator(config, restart)
+    else:
+        crawler = Crawler(config, restart)
+    # SIGTERM and Ctrl-C drain the crawl and save it for a resume, SIGHUP
+    # reloads the config file.
+    SignalControl(crawler, config_file).install()
     crawler.start()
+    if replay_server is not None:
+        stop_replay_server(replay_server)
 
 
 
@@ -20,5 +38,9 @@ if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--replay", type=str, default=None,
+                        help="crawl a corpus file recorded with --record instead of the cache server")
+    parser.add_argument("--record", type=str, default=None,
+                        help="append every cache server response to this corpus file")
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    main(args.config_file, args.restart, args.replay, args.record)
@@ -0,0 +1,103 @@
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+from bs4.dammit import UnicodeDammit
+
+from tokenizer import TokenCounter, count_tokens
+
+class ParsedPage(object):
+    ''' Everything the crawler needs from a page, taken from a single parse.
+    Word counts and simhash features are counted from the text unless the
+    parser already counted them while it went. '''
+    def __init__(self, raw_text, hrefs, word_counts=None, features=None):
+        self.raw_text = raw_text
+        self.hrefs = hrefs
+        self._text = None
+        if word_counts is None:
+            word_counts = count_tokens(self.text)
+        if features is None:
+            features = count_tokens(self.text, pattern=None, lower=False)
+        self.word_counts = word_counts
+        self.features = features
+        self.token_count = sum(self.word_counts.values())
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = clean_text(self.raw_text)
+        return self._text
+
+def clean_text(text):
+    """Strip every line and drop the empty ones, as extract_content always did."""
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return '\n'.join(chunk for chunk in chunks if chunk)
+
+def decode(html_content):
+    if isinstance(html_content, str):
+        return html_content
+    try:
+        return bytes(html_content).decode("utf-8")
+    except UnicodeDecodeError:
+        # Let bs4 sniff the declared or most likely encoding.
+        return UnicodeDammit(bytes(html_content), is_html=True).unicode_markup or ""
+
+class StreamingPageParser(HTMLParser):
+    ''' Event based parser that collects the visible text and the anchor
+    hrefs of a page without building a tree. The words and simhash features
+    of the text are counted as it arrives. clean_text only changes
+    whitespace, so they count the same as on the cleaned text. '''
+    skipped_tags = {"script", "style"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks = []
+        self.hrefs = []
+        self.skip_depth = 0
+        self.words = TokenCounter()
+        self.features = TokenCounter(pattern=None, lower=False)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.skipped_tags:
+            self.skip_depth += 1
+        elif tag == "a":
+            href = None
+            for name, value in attrs:
+                if name == "href":
+                    href = value or ""
+            if href is not None:
+                self.hrefs.append(href)
+
+    def handle_endtag(self, tag):
+        if tag in self.skipped_tags and self.skip_depth:
+            self.skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.chunks.append(data)
+            self.words.feed(data)
+            self.features.feed(data)
+
+def parse_stream(html_content):
+    parser = StreamingPageParser()
+    parser.feed(decode(html_content))
+    parser.close()
+    return ParsedPage(
+        "".join(parser.chunks), parser.hrefs,
+        parser.words.close(), parser.features.close())
+
+def parse_soup(html_content, features='html.parser'):
+    soup = BeautifulSoup(html_content, features)
+    hrefs = [link['href'] for link in soup.find_all('a', href=True)]
+    for script_or_style in soup(["script", "style"]):
+        script_or_style.decompose()
+    return ParsedPage(soup.get_text(), hrefs)
+
+BACKENDS = {
+    "stream": parse_stream,
+    "html.parser": lambda html_content: parse_soup(html_content, 'html.parser'),
+    "lxml": lambda html_content: parse_soup(html_content, 'lxml'),
+}
+
+def parse_page(html_content, backend="stream"):
+    return BACKENDS[backend](html_content)
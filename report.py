@@ -1,7 +1,17 @@
+import os
+import heapq
+import pickle
+from collections import Counter
+from threading import RLock, Thread, Event
 from urllib.parse import urlparse
 
+from tokenizer import TOKEN_PATTERN
+
 class Report():
     def __init__(self):
+        # Running totals, updated once per page so that writing the report
+        # never has to look at past pages again.
+        self.lock = RLock()
         self.longest_page = ''
         self.longest_page_length = 0
         self.subdomains = dict()
@@ -27,62 +37,102 @@ class Report():
             'would', "wouldn't",
             'you', "you'd", "you'll", "you're", "you've", 'your', 'yours', 'yourself', 'yourselves'
         }
-        self.total_tokens = []
+        self.word_frequencies = Counter()
+        self.stop_reporting = Event()
     
     def tokenize(self, text):
-        tokens = []
-        word = ""
-        for char in text:
-            if 'a' <= char <= 'z' or 'A' <= char <= 'Z' or '0' <= char <= '9':
-                word += char.lower()
-            elif word:
-                tokens.append(word)
-                word = ''
-        if word:
-            tokens.append(word)
-        return tokens
+        return [token.lower() for token in TOKEN_PATTERN.findall(text)]
     
     def computeWordFrequencies(self, token_list):
-        frequencies = {}
-        for token in token_list:
-            if token not in self.stop_words:
-                if token in frequencies:
-                    frequencies[token] += 1
-                else:
-                    frequencies[token] = 1
-        return frequencies
+        return Counter(token for token in token_list if token not in self.stop_words)
 
 
-    def add_current_link_data(self, soup, resp):
-        tokens = self.tokenize(soup.get_text(separator=' ', strip=True))
-        if len(tokens) > self.longest_page_length:
-            self.longest_page = resp.url
-            self.longest_page_length = len(tokens)
-        self.total_tokens.extend(tokens)
+    def add_current_link_data(self, page, resp):
+        counts = {word: count for word, count in page.word_counts.items()
+                  if word not in self.stop_words}
+        with self.lock:
+            if page.token_count > self.longest_page_length:
+                self.longest_page = resp.url
+                self.longest_page_length = page.token_count
+            self.word_frequencies.update(counts)
     
     def add_current_url_and_ics_subdomain(self, url):
-        self.unique_urls.add(url)
         parsed = urlparse(url)
-        if parsed.netloc.endswith(".ics.uci.edu") and parsed.netloc != "www.ics.uci.edu":
-            if parsed.netloc in self.subdomains:
-                self.subdomains[parsed.netloc] += 1
-            else:
-                self.subdomains[parsed.netloc] = 1
+        with self.lock:
+            self.unique_urls.add(url)
+            if parsed.netloc.endswith(".ics.uci.edu") and parsed.netloc != "www.ics.uci.edu":
+                if parsed.netloc in self.subdomains:
+                    self.subdomains[parsed.netloc] += 1
+                else:
+                    self.subdomains[parsed.netloc] = 1
+
+    def state(self):
+        ''' Copy of the running totals, for merge. '''
+        with self.lock:
+            return {
+                "longest_page": self.longest_page,
+                "longest_page_length": self.longest_page_length,
+                "subdomains": dict(self.subdomains),
+                "unique_urls": set(self.unique_urls),
+                "word_frequencies": Counter(self.word_frequencies),
+            }
+
+    def merge(self, state):
+        ''' Adds the totals of another report, as returned by its state. '''
+        with self.lock:
+            if state["longest_page_length"] > self.longest_page_length:
+                self.longest_page = state["longest_page"]
+                self.longest_page_length = state["longest_page_length"]
+            for subdomain, count in state["subdomains"].items():
+                self.subdomains[subdomain] = self.subdomains.get(subdomain, 0) + count
+            self.unique_urls |= state["unique_urls"]
+            self.word_frequencies.update(state["word_frequencies"])
+
+    def save(self, filename):
+        ''' Writes the running totals, so a resumed crawl can load them. '''
+        state = self.state()
+        tmp_filename = f"{filename}.tmp"
+        with open(tmp_filename, 'wb') as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filename, filename)
+
+    def load(self, filename):
+        ''' Merges the totals written by save, if there are any. '''
+        if os.path.exists(filename):
+            with open(filename, 'rb') as file:
+                self.merge(pickle.load(file))
 
     def generate_report(self, filename='report.txt'):
-        with open(filename, 'w') as file:
-            file.write(f"Total unique pages: {len(self.unique_urls)}\n\n")
-            file.write(f"Longest page: {self.longest_page} with {self.longest_page_length} words\n\n")
+        with self.lock:
+            unique_count = len(self.unique_urls)
+            longest_page, longest_page_length = self.longest_page, self.longest_page_length
+            # Top 50 words without sorting the whole vocabulary.
+            top_words = heapq.nlargest(50, self.word_frequencies.items(), key=lambda x: x[1])
+            subdomains = list(self.subdomains.items())
+        # Write next to the report and rename over it, so report.txt is never
+        # seen half written.
+        tmp_filename = f"{filename}.tmp"
+        with open(tmp_filename, 'w') as file:
+            file.write(f"Total unique pages: {unique_count}\n\n")
+            file.write(f"Longest page: {longest_page} with {longest_page_length} words\n\n")
             file.write("Most common words:\n")
-            flat_tokens = [token for sublist in self.total_tokens for token in sublist]
-            words = self.computeWordFrequencies(flat_tokens)
-            sorted_words = sorted(words.items(), key=lambda x: x[1], reverse=True)
             # Write the top 50 words
-            for word, count in sorted_words[:50]:
+            for word, count in top_words:
                 file.write(f"{word}: {count}\n")
             file.write(f"\n")
             
             file.write("Subdomains in ics.uci.edu:\n")
             # Write all subdomains and their frequencies
-            for subdomain, count in self.subdomains.items():
-                file.write(f"{subdomain}: {count}\n")
\ No newline at end of file
+            for subdomain, count in subdomains:
+                file.write(f"{subdomain}: {count}\n")
+        os.replace(tmp_filename, filename)
+
+    def start_periodic_report(self, interval, filename='report.txt'):
+        def write_periodically():
+            while not self.stop_reporting.wait(interval):
+                self.generate_report(filename)
+        Thread(target=write_periodically, daemon=True).start()
+
+    def stop_periodic_report(self, filename='report.txt'):
+        self.stop_reporting.set()
+        self.generate_report(filename)
\ No newline at end of file
@@ -1,12 +1,65 @@
-import re
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse, urljoin
-from urllib.robotparser import RobotFileParser
-from simhash_detection import page_content, detect_near_duplicates
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from urllib.parse import urljoin
+from utils.robots import RobotsManager
+from utils.metrics import metrics
+from simhash_detection import (
+    simhash, detect_near_duplicates, set_hash_version, open_store, close_store)
+from page_parser import parse_page, BACKENDS
+from url_filter import UrlFilter, TRAP_RULES
 
 from report import Report
 
 report_instance = Report()
+parser_backend = "stream"
+simhash_version = 2
+robots = None
+report_state_file = None
+parse_pool = None
+url_filter = UrlFilter()
+
+def build_url_filter(domains, trap_rules):
+    # Also the initializer of the parse processes, so they filter links the
+    # same way.
+    global url_filter
+    url_filter = UrlFilter(domains, trap_rules=[TRAP_RULES[name] for name in trap_rules])
+
+def configure(config, restart=False):
+    # Called once by the crawler before any page is scraped.
+    global parser_backend, simhash_version, robots, parse_pool, report_state_file
+    assert config.parser_backend in BACKENDS, f"PARSER should be one of {', '.join(BACKENDS)}"
+    assert set(config.trap_rules) <= set(TRAP_RULES), f"TRAPRULES should be among {', '.join(TRAP_RULES)}"
+    build_url_filter(config.allowed_domains, config.trap_rules)
+    parser_backend = config.parser_backend
+    simhash_version = config.simhash_version
+    set_hash_version(simhash_version)
+    open_store(config.save_file, restart)
+    # The report totals of a resumed crawl go on from where it stopped.
+    report_state_file = f"{config.save_file}.report"
+    if restart:
+        if os.path.exists(report_state_file):
+            os.remove(report_state_file)
+    else:
+        report_instance.load(report_state_file)
+    robots = RobotsManager(config)
+    if config.parse_processes > 0:
+        # spawn, since forking a process that already runs threads is unsafe.
+        parse_pool = ProcessPoolExecutor(
+            max_workers=config.parse_processes, mp_context=get_context("spawn"),
+            initializer=build_url_filter, initargs=(config.allowed_domains, config.trap_rules))
+
+def shutdown():
+    global parse_pool
+    if robots is not None:
+        robots.close()
+    if parse_pool is not None:
+        parse_pool.shutdown()
+        parse_pool = None
+    close_store()
+    if report_state_file is not None:
+        report_instance.save(report_state_file)
 
 def scraper(url, resp):
     links = extract_next_links(url, resp)
@@ -15,27 +68,51 @@ def scraper(url, resp):
 def extract_content(html_content):
     """Extract plain text content from HTML, 
     removing all scripts and styles."""
-    soup = BeautifulSoup(html_content, 'html.parser')
-    for script_or_style in soup(["script", "style"]):
-        script_or_style.decompose()
-    text = soup.get_text()
-    lines = (line.strip() for line in text.splitlines())
-    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-    text = '\n'.join(chunk for chunk in chunks if chunk)
-    return text
-
-
-
-robots_cache = {}
-def can_fetch_robot(url):
-    parsed_url = urlparse(url)
-    root_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
-    if root_url not in robots_cache:
-        rp = RobotFileParser() # use the RobotFileParser to parse robot.txt
-        rp.set_url(f"{root_url}/robots.txt")
-        rp.read()
-        robots_cache[root_url] = rp
-    return robots_cache[root_url].can_fetch("*", url)
+    return parse_page(html_content, parser_backend).text
+
+class PageSummary(object):
+    ''' The parts of a parsed page the crawler keeps: its valid absolute
+    links, word counts and fingerprint. Small enough to send back from a
+    parse process. timings holds the seconds spent parsing and
+    fingerprinting, wherever that ran. '''
+    def __init__(self, links, word_counts, token_count, fingerprint, timings):
+        self.links = links
+        self.word_counts = word_counts
+        self.token_count = token_count
+        self.fingerprint = fingerprint
+        self.timings = timings
+
+def summarize_page(html_content, base_url, backend, version):
+    """All the CPU bound work on a page. It only depends on its arguments,
+    so it can run in a parse process."""
+    start = time.perf_counter()
+    page = parse_page(html_content, backend)
+    links = {urljoin(base_url, href) for href in page.hrefs}
+    links = [link for link in links if is_valid(link)]
+    parsed = time.perf_counter()
+    page_fingerprint = simhash(page.features, version=version)
+    timings = {"parse": parsed - start, "fingerprint": time.perf_counter() - parsed}
+    return PageSummary(
+        links, page.word_counts, page.token_count, page_fingerprint, timings)
+
+
+
+def can_fetch_robot(url, timeout=None):
+    # Never blocks unless a timeout is given, hosts whose robots.txt is not
+    # known yet are allowed while it is fetched in the background.
+    if robots is None:
+        return True
+    with metrics.timer("robots"):
+        allowed = robots.can_fetch(url, timeout)
+    if not allowed:
+        metrics.count("robots_disallowed")
+    return allowed
+
+def crawl_delay(url):
+    # Crawl-delay from the robots.txt of the url's host, None if unknown.
+    if robots is None:
+        return None
+    return robots.crawl_delay(url)
 
 def extract_next_links(url, resp):
     # url: the URL that was used to get the page
@@ -46,21 +123,28 @@ def extract_next_links(url, resp):
     # Return a list with the hyperlinks (as strings) scrapped from resp.raw_response.content
     if resp.status != 200 or not resp.raw_response or not resp.raw_response.content:
         return []  # Ignore non-200 responses and empty content
-    # soup = BeautifulSoup(resp.raw_response.content, 'html.parser')
-    #report_instance.add_current_link_data(soup, resp)
-    # content = extract_content(soup)
-    content = extract_content(resp.raw_response.content)
-    page_simhash = page_content(url, content)
+    # One parse gives the links, the word counts and the fingerprint of the
+    # page. The shared state below (report, duplicates, robots) stays here.
+    args = (resp.raw_response.content, resp.url, parser_backend, simhash_version)
+    with metrics.timer("summarize"):
+        if parse_pool is None:
+            page = summarize_page(*args)
+        else:
+            page = parse_pool.submit(summarize_page, *args).result()
+    for stage, seconds in page.timings.items():
+        metrics.observe(f"{stage}_seconds", seconds)
+    with metrics.timer("report"):
+        report_instance.add_current_link_data(page, resp)
     # if error_content(content):
     #   return []
-    # page_simhash = page_content(url, content)
-    if detect_near_duplicates(url, page_simhash):
+    with metrics.timer("near_duplicates"):
+        is_near_duplicate = detect_near_duplicates(url, page.fingerprint)
+    if is_near_duplicate:
+        metrics.count("near_duplicates")
         return [] #Ignore urls with great page similarity
-    soup = BeautifulSoup(resp.raw_response.content, 'html.parser')
     found_links = set()
-    for link in soup.find_all('a', href=True):
-        abs_url = urljoin(resp.url, link['href'])
-        if is_valid(abs_url) and can_fetch_robot(abs_url):
+    for abs_url in page.links:
+        if can_fetch_robot(abs_url):
             found_links.add(abs_url)
             report_instance.add_current_url_and_ics_subdomain(abs_url)
     return list(found_links)
@@ -68,42 +152,19 @@ def extract_next_links(url, resp):
 def is_valid(url):
     # Decide whether to crawl this url or not. 
     # If you decide to crawl it, return True; otherwise return False.
-    # There are already some conditions that return False.
+    # The rules live in url_filter, built once by configure.
     try:
-        parsed = urlparse(url)
-        if parsed.scheme not in set(["http", "https"]):
-            return False
-        """valid_domains = [
-            "ics.uci.edu",
-            "cs.uci.edu",
-            "informatics.uci.edu",
-            "stat.uci.edu"
-        ]
-        domain = parsed.netloc
-        if not any(domain == d or domain.endswith('.' + d)for d in valid_domains):
-            return False #exclude urls invalid domains"""
-        valid_domains = [
-            ".ics.uci.edu",
-            ".cs.uci.edu",
-            ".informatics.uci.edu",
-            ".stat.uci.edu"
-        ]
-        domain = parsed.netloc
-        if not any(domain.endswith(d) for d in valid_domains):
-            return False
-        return not re.match(
-            r".*\.(css|js|bmp|gif|jpe?g|ico"
-            + r"|png|tiff?|mid|mp2|mp3|mp4"
-            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-            + r"|epub|dll|cnf|tgz|sha1"
-            + r"|thmx|mso|arff|rtf|jar|csv"
-            + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower())
-
+        return url_filter.is_valid(url)
     except TypeError:
-        print ("TypeError for ", parsed)
+        print ("TypeError for ", url)
         raise
 
 def generate_current_report():
-    report_instance.generate_report()
\ No newline at end of file
+    report_instance.generate_report()
+
+def start_reporting(interval, filename='report.txt'):
+    report_instance.start_periodic_report(interval, filename)
+
+def stop_reporting(filename='report.txt'):
+    # Stops the periodic report and writes the final one.
+    report_instance.stop_periodic_report(filename)
\ No newline at end of file
@@ -1,4 +1,26 @@
-simhashes = {}
+from array import array
+from hashlib import blake2b
+from threading import RLock
+
+from simhash_store import SimhashStore
+from tokenizer import count_tokens
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, simhash falls back to the pure python version.
+    np = None
+
+# Version 1 hashes features with simple_hash. For ordinary words it never
+# sets the high bits, so their fingerprint bits are always 0 and unrelated
+# pages look alike. Version 2 hashes with blake2b, which spreads every word
+# over all the bits. Fingerprints of different versions are not comparable.
+hash_version = 2
+
+def set_hash_version(version):
+    global hash_version
+    assert version in (1, 2), "Simhash version should be 1 or 2"
+    hash_version = version
 
 def simple_hash(value, hash_bits=64):
     hash_value = 0 # Set the initial value to zero
@@ -7,6 +29,15 @@ def simple_hash(value, hash_bits=64):
         hash_value += ord(char)
     return hash_value % (1 << hash_bits)
 
+def blake_hash(value, hash_bits=64):
+    digest = blake2b(value.encode("utf-8", "surrogatepass"), digest_size=(hash_bits + 7) // 8)
+    return int.from_bytes(digest.digest(), "little") % (1 << hash_bits)
+
+def feature_hash(value, hash_bits=64, version=None):
+    if (version or hash_version) == 1:
+        return simple_hash(value, hash_bits)
+    return blake_hash(value, hash_bits)
+
 """def tokenize(text):
     # okenize
     # the content in urls
@@ -24,12 +55,17 @@ def simple_hash(value, hash_bits=64):
         tokens.append(temp_word) 
     return tokens"""
 
-def simhash(features, hash_bits=64):
+def simhash(features, hash_bits=64, version=None):
     """
     compute the simhash of the provided features"""
+    if np is not None and hash_bits == 64:
+        return simhash_numpy(features, version)
+    return simhash_python(features, hash_bits, version)
+
+def simhash_python(features, hash_bits=64, version=None):
     v = [0] * hash_bits
     for feature, weight in features.items():
-        hash_value = simple_hash(feature, hash_bits)
+        hash_value = feature_hash(feature, hash_bits, version)
         for i in range(hash_bits):
             bitmask = 1 << i # Isolate the current bit
             if hash_value & bitmask:
@@ -43,34 +79,157 @@ def simhash(features, hash_bits=64):
                                     # the fingerprint
     return fingerprint
 
+def simple_hashes_numpy(features):
+    """
+    simple_hash of every feature at once, as a uint64 array.
+    While the running hash stays below 2**63 the rotated in bit is always
+    zero, so the hash of c0 c1 ... cn is just the sum of ci << (n - i). That
+    is computed for all features together from their utf-32 code points, and
+    the few that could grow past 63 bits (very long words, wide characters)
+    are redone with simple_hash."""
+    lengths = np.fromiter(map(len, features), dtype=np.int64, count=len(features))
+    nonempty = np.flatnonzero(lengths)
+    hashes = np.zeros(len(features), dtype=np.uint64)
+    if len(nonempty):
+        codes = np.frombuffer(
+            "".join(features).encode("utf-32-le", "surrogatepass"),
+            dtype=np.uint32).astype(np.uint64)
+        ends = np.cumsum(lengths)
+        starts = (ends - lengths)[nonempty]
+        shifts = np.repeat(ends, lengths) - 1 - np.arange(len(codes))
+        terms = codes << np.minimum(shifts, 63).astype(np.uint64)
+        hashes[nonempty] = np.add.reduceat(terms, starts)
+        widest = np.maximum.reduceat(codes, starts).astype(np.float64)
+        exact = lengths[nonempty] + np.ceil(np.log2(widest + 1)) <= 63
+        for i in nonempty[~exact]:
+            hashes[i] = simple_hash(features[i])
+    return hashes
+
+def simhash_numpy(features, version=None):
+    if not features:
+        return 0
+    if (version or hash_version) == 1:
+        hashes = simple_hashes_numpy(list(features.keys()))
+    else:
+        hashes = np.fromiter(map(blake_hash, features), dtype=np.uint64, count=len(features))
+    weights = np.fromiter(features.values(), dtype=np.int64, count=len(features))
+    bits = ((hashes[:, None] >> np.arange(64, dtype=np.uint64)) & np.uint64(1)).astype(np.int64)
+    # Each feature votes +weight for its set bits and -weight for the others.
+    votes = weights @ (2 * bits - 1)
+    positive = np.flatnonzero(votes > 0)
+    return int(np.bitwise_or.reduce(np.uint64(1) << positive.astype(np.uint64), initial=np.uint64(0)))
+
+try:
+    _popcount = int.bit_count
+except AttributeError:
+    # int.bit_count is new in python 3.10.
+    def _popcount(x):
+        return bin(x).count("1")
+
 def hamming_distance(hash1, hash2):
-    x = hash1 ^ hash2
-    distance = 0
-    while x:
-        distance += 1
-        x &= x - 1 
-    return distance
+    return _popcount(hash1 ^ hash2)
 
 def calculate_features(text):
-    words = words = text.split()
-    weights = {}
-    for word in words:
-        weights[word] = weights.get(word, 0) + 1
-    return weights
+    # Whitespace separated words, case kept, weighted by their count.
+    return count_tokens(text, pattern=None, lower=False)
 
 
+def fingerprint(content, version=None):
+    return simhash(calculate_features(content), version=version)
+
+def record_simhash(url, page_simhash):
+    simhash_index.add(url, page_simhash)
+
 def page_content(url, content):
-    features = calculate_features(content)
-    page_simhash = simhash(features)
-    simhashes[url] = page_simhash
+    page_simhash = fingerprint(content)
+    record_simhash(url, page_simhash)
     return page_simhash
 
+class SimhashIndex(object):
+    """
+    Near duplicate lookup over simhash fingerprints. The fingerprint is cut
+    into max_distance + 1 bit blocks and every block keys its own table. Two
+    fingerprints at most max_distance bits apart must agree on at least one
+    whole block, so a lookup only compares against the fingerprints that
+    share a block with it instead of every page seen so far.
+    The fingerprints and urls live in a SimhashStore, the tables only hold
+    their ids, and the fingerprints already in the store are indexed first."""
+    def __init__(self, max_distance=4, hash_bits=64, store=None):
+        assert hash_bits <= 64, "The store keeps fingerprints of at most 64 bits"
+        self.max_distance = max_distance
+        self.hash_bits = hash_bits
+        self.store = store if store is not None else SimhashStore()
+        self.lock = RLock()
+        blocks = max_distance + 1
+        self.blocks = []
+        for i in range(blocks):
+            start = i * hash_bits // blocks
+            end = (i + 1) * hash_bits // blocks
+            self.blocks.append((start, (1 << (end - start)) - 1))
+        self.tables = [dict() for _ in self.blocks]
+        for id in range(len(self.store)):
+            self._index(id, self.store.fingerprint(id))
+
+    def _keys(self, fingerprint):
+        return [(fingerprint >> start) & mask for start, mask in self.blocks]
+
+    def _index(self, id, fingerprint):
+        for table, key in zip(self.tables, self._keys(fingerprint)):
+            ids = table.get(key)
+            if ids is None:
+                ids = table[key] = array("I")
+            ids.append(id)
+
+    def add(self, url, fingerprint):
+        with self.lock:
+            self._index(self.store.add(url, fingerprint), fingerprint)
+
+    def find(self, url, fingerprint, threshold=5):
+        """ Return the url of a different page less than threshold bits away, or None"""
+        with self.lock:
+            if threshold - 1 > self.max_distance:
+                # The blocks are too small to guarantee a shared one, compare
+                # against everything instead.
+                candidates = range(len(self.store))
+            else:
+                candidates = (id
+                              for table, key in zip(self.tables, self._keys(fingerprint))
+                              for id in table.get(key, ()))
+            for id in candidates:
+                if hamming_distance(fingerprint, self.store.fingerprint(id)) < threshold:
+                    existing_url = self.store.url(id)
+                    if existing_url != url:
+                        return existing_url
+            return None
+
+    def add_if_unique(self, url, fingerprint, threshold=5):
+        """ Add the fingerprint unless a near duplicate is indexed, returns True if it was a duplicate"""
+        with self.lock:
+            if self.find(url, fingerprint, threshold) is not None:
+                return True
+            self.add(url, fingerprint)
+            return False
+
+    def close(self):
+        with self.lock:
+            self.store.close()
+
+    def __len__(self):
+        return len(self.store)
+
+simhash_index = SimhashIndex()
+
+def open_store(filename, restart=False):
+    """
+    Backs the index with the store in filename.simhash, so a resumed crawl
+    still knows the pages it fingerprinted before. Fingerprints of another
+    hash version are dropped."""
+    global simhash_index
+    simhash_index = SimhashIndex(store=SimhashStore(filename, restart, hash_version))
+
+def close_store():
+    simhash_index.close()
+
 def detect_near_duplicates(url, new_simhash, threshold = 5):
     """ Provide a decent thrshold, 5 indicates to ingnore pages with about 92% similarity"""
-    global simhashes
-    for existing_url, existing_simhash in simhashes.items():
-        if hamming_distance(new_simhash, existing_simhash) < threshold:
-            # simhashes[url] = new_simhash
-            return True
-    simhashes[url] = new_simhash
-    return False
+    return simhash_index.add_if_unique(url, new_simhash, threshold)
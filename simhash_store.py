@@ -0,0 +1,122 @@
+import os
+import mmap
+import struct
+
+from array import array
+from threading import RLock
+
+# Number of fingerprints and the hash version they were made with.
+HEADER = struct.Struct("<QQ")
+
+class SimhashStore(object):
+    """
+    Fingerprints of the pages seen so far, one uint64 each, with ids in the
+    order they were added. Without a filename they are only kept in memory.
+    With one, they are memory mapped from filename.simhash and the urls are
+    appended to filename.simhash-urls, one per line, so a resumed crawl
+    starts with every fingerprint it had. Only the end offset of each url
+    stays in memory. A store made with another hash version is cleared,
+    since its fingerprints are not comparable."""
+
+    def __init__(self, filename=None, restart=False, version=0, capacity=1 << 16):
+        self.lock = RLock()
+        self.count = 0
+        self.map = None
+        self.fingerprints = array("Q")
+        self.urls = list()
+        if filename is not None:
+            self._open(filename, restart, version, capacity)
+
+    def _open(self, filename, restart, version, capacity):
+        self.fingerprint_file = f"{filename}.simhash"
+        self.url_file_name = f"{filename}.simhash-urls"
+        if restart or not self._has_version(version):
+            for path in (self.fingerprint_file, self.url_file_name):
+                if os.path.exists(path):
+                    os.remove(path)
+        if not os.path.exists(self.fingerprint_file):
+            with open(self.fingerprint_file, "wb") as file:
+                file.write(HEADER.pack(0, version))
+                file.truncate(HEADER.size + 8 * capacity)
+        self._map()
+        self.count = HEADER.unpack_from(self.map, 0)[0]
+
+        self.url_file = open(self.url_file_name, "a+b")
+        self.url_file.seek(0)
+        self.url_ends = array("Q")
+        end = 0
+        for line in self.url_file:
+            if len(self.url_ends) == self.count:
+                break
+            end += len(line)
+            self.url_ends.append(end)
+        # Urls written after the last counted fingerprint are dropped, and
+        # fingerprints without their url too.
+        self.url_file.truncate(end)
+        self.count = len(self.url_ends)
+        HEADER.pack_into(self.map, 0, self.count, version)
+
+    def _has_version(self, version):
+        if not os.path.exists(self.fingerprint_file):
+            return True
+        with open(self.fingerprint_file, "rb") as file:
+            header = file.read(HEADER.size)
+        return len(header) == HEADER.size and HEADER.unpack(header)[1] == version
+
+    def _map(self):
+        with open(self.fingerprint_file, "r+b") as file:
+            self.map = mmap.mmap(file.fileno(), 0)
+        self.fingerprints = memoryview(self.map)[HEADER.size:].cast("Q")
+
+    def _grow(self):
+        capacity = 2 * len(self.fingerprints)
+        self.fingerprints.release()
+        self.map.close()
+        with open(self.fingerprint_file, "r+b") as file:
+            file.truncate(HEADER.size + 8 * capacity)
+        self._map()
+
+    def add(self, url, fingerprint):
+        """ Stores a fingerprint, returns its id."""
+        with self.lock:
+            if self.map is None:
+                self.fingerprints.append(fingerprint)
+                self.urls.append(url)
+            else:
+                if self.count == len(self.fingerprints):
+                    self._grow()
+                data = url.encode("utf-8", "surrogatepass") + b"\n"
+                self.url_file.write(data)
+                self.url_file.flush()
+                self.url_ends.append(self.url_file.tell())
+                self.fingerprints[self.count] = fingerprint
+                # The count is written last, a crash before it only loses
+                # this page.
+                HEADER.pack_into(self.map, 0, self.count + 1, HEADER.unpack_from(self.map, 0)[1])
+            self.count += 1
+            return self.count - 1
+
+    def fingerprint(self, id):
+        return self.fingerprints[id]
+
+    def url(self, id):
+        with self.lock:
+            if self.map is None:
+                return self.urls[id]
+            start = self.url_ends[id - 1] if id else 0
+            data = os.pread(self.url_file.fileno(), self.url_ends[id] - start - 1, start)
+            return data.decode("utf-8", "surrogatepass")
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        with self.lock:
+            if self.map is None:
+                return
+            self.fingerprints.release()
+            self.map.flush()
+            self.map.close()
+            self.map = None
+            self.fingerprints = array("Q")
+            self.url_file.close()
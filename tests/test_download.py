@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+
+from configparser import ConfigParser
+from threading import Thread
+
+from utils.config import Config
+from utils.download import download
+from utils.replay import Corpus, CorpusWriter, ReplayHandler, ReplayServer, cache_server_body
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+URL = "https://www.ics.uci.edu/page"
+
+class DroppingHandler(ReplayHandler):
+    ''' Sends half of the recorded body and hangs up, while the server has
+    drops left. '''
+
+    def do_GET(self):
+        if self.server.drops <= 0:
+            return super().do_GET()
+        self.server.drops -= 1
+        status, body = self.server.corpus.get(URL)
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body[:len(body) // 2])
+        self.wfile.flush()
+        self.close_connection = True
+
+class DownloadTest(unittest.TestCase):
+    ''' A connection dropped in the middle of a body is retried like any
+    other connection error, and fails the download without raising once
+    the retries run out. '''
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        corpus_file = os.path.join(directory.name, "corpus.bin")
+        writer = CorpusWriter(corpus_file)
+        writer.record(URL, 200, cache_server_body(URL, b"<html><body>" + b"word " * 20000 + b"</body></html>"))
+        writer.close()
+        self.server = ReplayServer(Corpus(corpus_file))
+        self.server.RequestHandlerClass = DroppingHandler
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def make_config(self, max_page_size):
+        parser = ConfigParser()
+        parser.read(os.path.join(ROOT, "config.ini"))
+        parser["CONNECTION"]["RETRIES"] = "2"
+        parser["CONNECTION"]["BACKOFF"] = "0.01"
+        parser["CRAWLER"]["MAXPAGESIZE"] = str(max_page_size)
+        config = Config(parser)
+        config.cache_server = self.server.server_address
+        return config
+
+    def test_retries_dropped_body(self):
+        for max_page_size in (0, 1 << 20):
+            with self.subTest(max_page_size=max_page_size):
+                self.server.drops = 2
+                resp = download(URL, self.make_config(max_page_size))
+                self.assertEqual(resp.status, 200)
+                self.assertEqual(self.server.drops, 0)
+
+    def test_fails_after_retries(self):
+        for max_page_size in (0, 1 << 20):
+            with self.subTest(max_page_size=max_page_size):
+                self.server.drops = 3
+                resp = download(URL, self.make_config(max_page_size))
+                self.assertEqual(resp.status, 0)
+                self.assertEqual(self.server.drops, 0)
+
+if __name__ == "__main__":
+    unittest.main()
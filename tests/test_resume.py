@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+
+from configparser import ConfigParser
+from threading import Thread
+
+from crawler.frontier import Frontier
+from crawler.persistence import BatchedSave, SqliteSave
+from utils import get_urlhash
+from utils.config import Config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class ResumeTest(unittest.TestCase):
+    ''' A resumed crawl pages through the pending urls of its save file while
+    workers keep reading and writing that save. '''
+
+    def make_config(self, save_format, hot_window=8):
+        parser = ConfigParser()
+        parser.read(os.path.join(ROOT, "config.ini"))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        parser["LOCAL PROPERTIES"]["SAVE"] = os.path.join(directory.name, "frontier")
+        parser["LOCAL PROPERTIES"]["SAVEFORMAT"] = save_format
+        parser["LOCAL PROPERTIES"]["RESUMEPAGE"] = "5"
+        parser["LOCAL PROPERTIES"]["HOTWINDOW"] = str(hot_window)
+        parser["CRAWLER"]["POLITENESS"] = "0"
+        return Config(parser)
+
+    def save_crawl(self, config, save_factory, pending, completed):
+        save = save_factory(config.save_file, restart=True)
+        for url, depth in pending.items():
+            save[get_urlhash(url)] = (url, False, depth)
+        for url in completed:
+            save[get_urlhash(url)] = (url, True, 1)
+        save.close()
+
+    def resume(self, config):
+        frontier = Frontier(config, restart=False)
+        downloaded = dict()
+
+        def work():
+            while True:
+                tbd = frontier.get_tbd_url()
+                if tbd is None:
+                    break
+                url, depth = tbd
+                downloaded[url] = depth
+                if not url.endswith("/next"):
+                    frontier.add_url(f"{url}/next", depth)
+                frontier.mark_url_complete(url)
+
+        worker = Thread(target=work, daemon=True)
+        worker.start()
+        worker.join(30)
+        self.assertFalse(worker.is_alive(), "resumed crawl did not finish")
+        frontier.close()
+        return downloaded
+
+    def check_resume(self, save_format, save_factory, hot_window=8, pending=None):
+        config = self.make_config(save_format, hot_window)
+        if pending is None:
+            pending = {f"https://www.ics.uci.edu/page{i}": 1 for i in range(23)}
+        completed = [f"https://www.ics.uci.edu/done{i}" for i in range(7)]
+        self.save_crawl(config, save_factory, pending, completed)
+        # Urls are handed out one deeper than they were saved, as add_url
+        # does in a fresh crawl, and add_url drops links past depth 5.
+        expected = dict()
+        for url, depth in pending.items():
+            expected[url] = depth + 1
+            if depth + 1 <= 5:
+                expected[f"{url}/next"] = depth + 2
+        self.assertEqual(self.resume(config), expected)
+
+    def test_resume_shelve(self):
+        self.check_resume("shelve", BatchedSave)
+
+    def test_resume_sqlite(self):
+        self.check_resume("sqlite", SqliteSave)
+
+    def test_resume_depths(self):
+        pending = {f"https://www.ics.uci.edu/depth{depth}": depth for depth in range(6)}
+        for save_format, save_factory in (("shelve", BatchedSave), ("sqlite", SqliteSave)):
+            with self.subTest(save_format=save_format):
+                self.check_resume(save_format, save_factory, pending=pending)
+
+    def test_resume_small_hot_window(self):
+        # Spilled urls are still read back when a quarter of the window is 0.
+        for hot_window in (1, 2, 3):
+            with self.subTest(hot_window=hot_window):
+                self.check_resume("sqlite", SqliteSave, hot_window)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import re
+from collections import Counter
+
+# Report words: ascii alphanumeric runs, lowercased.
+TOKEN_PATTERN = re.compile(r"[a-zA-Z0-9]+")
+
+class TokenCounter(object):
+    ''' Counts the tokens of a text fed in chunks of any size, without
+    keeping more than batch_size characters of it. Tokens are the matches of
+    pattern, or the whitespace separated words if pattern is None, and a
+    token is a run of characters that each match. Small chunks, like the
+    text nodes of a page, are buffered and counted batch_size characters at
+    a time. A token running to the end of a batch is held back until the
+    next one shows whether it goes on. '''
+
+    def __init__(self, pattern=TOKEN_PATTERN, lower=True, batch_size=1 << 16):
+        self.pattern = pattern
+        self.lower = lower
+        self.batch_size = batch_size
+        self.counts = Counter()
+        self.tail = ""
+        self.buffer = []
+        self.buffered = 0
+
+    def _tokens(self, text, end):
+        if self.pattern is None:
+            return (text[:end] if end < len(text) else text).split()
+        return map(re.Match.group, self.pattern.finditer(text, 0, end))
+
+    def _in_token(self, text, index):
+        if self.pattern is None:
+            return not text[index].isspace()
+        return self.pattern.match(text, index) is not None
+
+    def _count(self, tokens):
+        # Lowercasing each token, not the text, keeps non ascii letters
+        # that lowercase to ascii ones out of the tokens.
+        self.counts.update(map(str.lower, tokens) if self.lower else tokens)
+
+    def feed(self, chunk):
+        self.buffer.append(chunk)
+        self.buffered += len(chunk)
+        if self.buffered >= self.batch_size:
+            self._count_buffer()
+
+    def _count_buffer(self):
+        if not self.buffer:
+            return
+        text = "".join(self.buffer) if len(self.buffer) > 1 else self.buffer[0]
+        if self.tail:
+            text = self.tail + text
+        self.buffer = []
+        self.buffered = 0
+        # Only the last token is scanned back over, to hold it back.
+        end = len(text)
+        while end and self._in_token(text, end - 1):
+            end -= 1
+        self.tail = text[end:]
+        if end:
+            self._count(self._tokens(text, end))
+
+    def close(self):
+        ''' Counts what is buffered and held back, and returns the counts. '''
+        self._count_buffer()
+        if self.tail:
+            self._count((self.tail,))
+            self.tail = ""
+        return self.counts
+
+def count_tokens(text, pattern=TOKEN_PATTERN, lower=True):
+    counter = TokenCounter(pattern, lower)
+    counter.feed(text)
+    return counter.close()
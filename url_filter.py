@@ -0,0 +1,102 @@
+import re
+from collections import Counter
+from functools import lru_cache
+from urllib.parse import urlparse, parse_qsl
+
+DEFAULT_DOMAINS = ["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu"]
+
+BLOCKED_EXTENSIONS = frozenset([
+    "css", "js", "bmp", "gif", "jpeg", "jpg", "ico",
+    "png", "tif", "tiff", "mid", "mp2", "mp3", "mp4",
+    "wav", "avi", "mov", "mpeg", "ram", "m4v", "mkv", "ogg", "ogv", "pdf",
+    "ps", "eps", "tex", "ppt", "pptx", "doc", "docx", "xls", "xlsx", "names",
+    "data", "dat", "exe", "bz2", "tar", "msi", "bin", "7z", "psd", "dmg", "iso",
+    "epub", "dll", "cnf", "tgz", "sha1",
+    "thmx", "mso", "arff", "rtf", "jar", "csv",
+    "rm", "smil", "wmv", "swf", "wma", "zip", "rar", "gz"])
+
+class DomainTrie(object):
+    ''' Matches hosts that are strict subdomains of any of the domains, the
+    same as host.endswith("." + domain), one label at a time. '''
+    def __init__(self, domains):
+        self.root = dict()
+        for domain in domains:
+            node = self.root
+            for label in reversed(domain.strip(".").split(".")):
+                node = node.setdefault(label, dict())
+            node[None] = True
+
+    def matches(self, host):
+        node = self.root
+        labels = host.split(".")
+        for i in range(len(labels) - 1, 0, -1):
+            node = node.get(labels[i])
+            if node is None:
+                return False
+            if None in node:
+                # At least one label is left in front of the domain.
+                return True
+        return False
+
+# Trap rules take a parsed url and return True if it looks like a trap.
+
+DATE_PATTERN = re.compile(r"\d{4}-\d{1,2}(-\d{1,2})?|\d{4}/\d{1,2}/\d{1,2}")
+CALENDAR_PATTERN = re.compile(r"calendar|/events?/|\bical\b|tribe-bar-date|/day/|/month/|/week/", re.IGNORECASE)
+# ical (or outlook-ical) as a whole parameter name or value, so that words
+# like "statistical" in a search query do not match.
+ICAL_QUERY_PATTERN = re.compile(r"(?:^|[&=])(?:outlook-)?ical(?:[=&]|$)", re.IGNORECASE)
+
+def calendar_trap(parsed):
+    ''' Calendar pages link to the next day or month forever. '''
+    if parsed.query and (DATE_PATTERN.search(parsed.query) or ICAL_QUERY_PATTERN.search(parsed.query)):
+        return True
+    return bool(CALENDAR_PATTERN.search(parsed.path) and DATE_PATTERN.search(parsed.path))
+
+def repeating_segments_trap(parsed, max_repeats=2):
+    ''' Relative links that keep appending the same directories. '''
+    segments = [segment for segment in parsed.path.split("/") if segment]
+    if len(segments) <= max_repeats:
+        return False
+    return Counter(segments).most_common(1)[0][1] > max_repeats
+
+def query_explosion_trap(parsed, max_params=5, max_length=200):
+    ''' Sorting, filtering and session parameters that multiply one page
+    into endless variants. '''
+    if not parsed.query:
+        return False
+    return (len(parsed.query) > max_length
+            or len(parse_qsl(parsed.query, keep_blank_values=True)) > max_params)
+
+TRAP_RULES = {
+    "calendar": calendar_trap,
+    "repeating_segments": repeating_segments_trap,
+    "query_explosion": query_explosion_trap,
+}
+
+class UrlFilter(object):
+    ''' Decides which urls are crawled. Built once, verdicts are memoized
+    per url (without its fragment) in an LRU of cache_size entries. '''
+    def __init__(self, domains=DEFAULT_DOMAINS, extensions=BLOCKED_EXTENSIONS,
+                 trap_rules=TRAP_RULES.values(), cache_size=1 << 16):
+        self.domains = DomainTrie(domains)
+        self.extensions = frozenset(extensions)
+        self.trap_rules = list(trap_rules)
+        self._cached_is_valid = lru_cache(maxsize=cache_size)(self._is_valid)
+
+    def is_valid(self, url):
+        return self._cached_is_valid(url.partition("#")[0])
+
+    def _is_valid(self, url):
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https"):
+            return False
+        if not self.domains.matches(parsed.netloc):
+            return False
+        path = parsed.path.lower()
+        dot = path.rfind(".")
+        if dot != -1 and path[dot + 1:] in self.extensions:
+            return False
+        return not any(rule(parsed) for rule in self.trap_rules)
+
+    def cache_info(self):
+        return self._cached_is_valid.cache_info()
@@ -1,4 +1,5 @@
 import re
+from importlib.util import find_spec
 
 
 class Config(object):
@@ -8,12 +9,53 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.engine = config["LOCAL PROPERTIES"].get("ENGINE", "threads").strip()
+        assert self.engine in ("threads", "asyncio"), "ENGINE should be threads or asyncio"
+        self.concurrency = config["LOCAL PROPERTIES"].getint("CONCURRENCY", fallback=200)
+        self.parse_processes = config["LOCAL PROPERTIES"].getint("PARSEPROCESSES", fallback=0)
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.save_format = config["LOCAL PROPERTIES"].get("SAVEFORMAT", "shelve").strip()
+        assert self.save_format in ("sqlite", "shelve"), "SAVEFORMAT should be sqlite or shelve"
+        self.resume_page_size = config["LOCAL PROPERTIES"].getint("RESUMEPAGE", fallback=10000)
+        self.hot_window = config["LOCAL PROPERTIES"].getint("HOTWINDOW", fallback=100000)
+        assert self.hot_window >= 1, "HOTWINDOW should be at least 1"
+        self.spill_buckets = config["LOCAL PROPERTIES"].getint("SPILLBUCKETS", fallback=64)
+        self.save_batch_size = config["LOCAL PROPERTIES"].getint("SAVEBATCH", fallback=100)
+        self.save_flush_interval = config["LOCAL PROPERTIES"].getfloat("SAVEINTERVAL", fallback=5.0)
+        self.seen_capacity = config["LOCAL PROPERTIES"].getint("SEENCAPACITY", fallback=10000000)
+        self.report_interval = config["LOCAL PROPERTIES"].getfloat("REPORTINTERVAL", fallback=60.0)
+        self.shard_count = config["LOCAL PROPERTIES"].getint("SHARDS", fallback=1)
+        self.metrics_file = config["LOCAL PROPERTIES"].get("METRICSFILE", "").strip()
+        self.metrics_interval = config["LOCAL PROPERTIES"].getfloat("METRICSINTERVAL", fallback=10.0)
+        self.profiler = config["LOCAL PROPERTIES"].get("PROFILER", "off").strip()
+        assert self.profiler in ("off", "cprofile", "sample"), "PROFILER should be off, cprofile or sample"
+        self.profile_file = config["LOCAL PROPERTIES"].get("PROFILEFILE", "profile.out").strip()
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        self.connect_timeout = config["CONNECTION"].getfloat("CONNECTTIMEOUT", fallback=5.0)
+        self.read_timeout = config["CONNECTION"].getfloat("READTIMEOUT", fallback=60.0)
+        self.download_retries = config["CONNECTION"].getint("RETRIES", fallback=3)
+        self.download_backoff = config["CONNECTION"].getfloat("BACKOFF", fallback=0.5)
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
+        self.allowed_domains = [
+            domain.strip() for domain in config["CRAWLER"].get(
+                "DOMAINS", "ics.uci.edu,cs.uci.edu,informatics.uci.edu,stat.uci.edu").split(",")
+            if domain.strip()]
+        self.trap_rules = [
+            rule.strip() for rule in config["CRAWLER"].get(
+                "TRAPRULES", "calendar,repeating_segments,query_explosion").split(",")
+            if rule.strip()]
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.robots_timeout = config["CRAWLER"].getfloat("ROBOTSTIMEOUT", fallback=10.0)
+        self.simhash_version = config["CRAWLER"].getint("SIMHASHVERSION", fallback=2)
+        self.parser_backend = config["CRAWLER"].get("PARSER", "stream").strip()
+        assert self.parser_backend != "lxml" or find_spec("lxml") is not None, "PARSER = lxml needs lxml installed, or use stream or html.parser"
+        self.max_page_size = config["CRAWLER"].getint("MAXPAGESIZE", fallback=0)
+        self.scorer = config["CRAWLER"].get("SCORER", "fifo").strip()
 
+        self.report_file = "report.txt"
+        # Corpus file that cache server responses are recorded to, if any.
+        self.record_file = None
         self.cache_server = None
\ No newline at end of file
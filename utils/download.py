@@ -1,21 +1,193 @@
 import requests
 import cbor
 import time
+import random
+import asyncio
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
 
 from utils.response import Response
+from utils.metrics import metrics, SIZE_BOUNDS
 
-def download(url, config, logger=None):
-    host, port = config.cache_server
-    resp = requests.get(
-        f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
+try:
+    import aiohttp
+except ImportError:
+    # aiohttp is optional, download_async falls back to a thread.
+    aiohttp = None
+
+# Status codes from the cache server itself worth asking again for.
+RETRY_STATUSES = {502, 503, 504}
+# Request errors worth asking again for, including a connection dropped in
+# the middle of a streamed body. Any other request error fails the download.
+RETRY_ERRORS = (
+    requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+# Room for the cbor and pickle around a page in a cache server response.
+ENVELOPE_SIZE = 1 << 16
+
+_local = threading.local()
+
+# A utils.replay.CorpusWriter that every cache server response is added to,
+# set by the crawler when it records a crawl.
+recorder = None
+
+def get_session():
+    ''' Keep-alive session to the cache server, one per thread since
+    requests sessions are not thread safe. '''
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+def backoff(config, attempt):
+    # Exponential backoff with full jitter, so retrying workers spread out.
+    return random.uniform(0, config.download_backoff * (2 ** attempt))
+
+def read_body(resp, max_size):
+    ''' Body of a streamed cache server response, or None without reading
+    the rest once it is too large for a page of max_size bytes. '''
+    if not max_size:
+        return resp.content
+    limit = max_size + ENVELOPE_SIZE
+    if int(resp.headers.get("Content-Length") or 0) > limit:
+        resp.close()
+        return None
+    chunks = list()
+    size = 0
+    for chunk in resp.iter_content(1 << 16):
+        size += len(chunk)
+        if size > limit:
+            resp.close()
+            return None
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+async def read_body_async(resp, max_size):
+    if not max_size:
+        return await resp.read()
+    limit = max_size + ENVELOPE_SIZE
+    if (resp.content_length or 0) > limit:
+        return None
+    chunks = list()
+    size = 0
+    async for chunk in resp.content.iter_chunked(1 << 16):
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def too_large_response(url, max_size, logger=None):
+    metrics.count("pages_too_large")
+    if logger:
+        logger.error(f"Page for url {url} is larger than {max_size} bytes, skipped.")
+    return Response({
+        "error": f"Page for url {url} is larger than {max_size} bytes.",
+        "status": 413,
+        "url": url})
+
+def to_response(url, status_code, content, logger=None, max_size=0):
+    if content is None:
+        return too_large_response(url, max_size, logger)
+    if recorder is not None:
+        recorder.record(url, status_code, content)
+    metrics.count(f"download_status_{status_code}")
+    if content:
+        metrics.observe("page_bytes", len(content), SIZE_BOUNDS)
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        if 200 <= status_code < 400 and content:
+            return Response(cbor.loads(content), max_size)
     except (EOFError, ValueError) as e:
         pass
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
+    if logger:
+        logger.error(f"Spacetime Response error {status_code} with url {url}.")
+    return Response({
+        "error": f"Spacetime Response error {status_code} with url {url}.",
+        "status": status_code,
+        "url": url})
+
+def failed_response(url, error, logger=None):
+    # Status 0: no usable response from the cache server at all.
+    metrics.count("download_status_0")
+    if logger:
+        logger.error(f"Cache server request failed for url {url}: {error}")
     return Response({
-        "error": f"Spacetime Response error {resp} with url {url}.",
-        "status": resp.status_code,
+        "error": f"Cache server request failed for url {url}: {error}",
+        "status": 0,
         "url": url})
+
+def download(url, config, logger=None):
+    with metrics.timer("download"):
+        return _download(url, config, logger)
+
+def _download(url, config, logger):
+    host, port = config.cache_server
+    session = get_session()
+    for attempt in range(config.download_retries + 1):
+        last_attempt = attempt == config.download_retries
+        try:
+            resp = session.get(
+                f"http://{host}:{port}/",
+                params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+                timeout=(config.connect_timeout, config.read_timeout), stream=True)
+            if resp.status_code not in RETRY_STATUSES or last_attempt:
+                content = read_body(resp, config.max_page_size)
+                return to_response(
+                    url, resp.status_code, content, logger, config.max_page_size)
+            resp.close()
+        except RETRY_ERRORS as e:
+            if last_attempt:
+                return failed_response(url, e, logger)
+        except requests.RequestException as e:
+            return failed_response(url, e, logger)
+        metrics.count("download_retries")
+        time.sleep(backoff(config, attempt))
+
+def download_many(urls, config, logger=None, concurrency=8):
+    ''' Download many urls concurrently, returns the responses in order. '''
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(lambda url: download(url, config, logger), urls))
+
+async def download_async(url, config, logger=None, session=None):
+    ''' download for asyncio code. With aiohttp installed and a
+    aiohttp.ClientSession given, it runs on the event loop, otherwise the
+    blocking download runs in the loop's default executor. '''
+    if aiohttp is None or session is None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, download, url, config, logger)
+    with metrics.timer("download"):
+        return await _download_async(url, config, logger, session)
+
+async def _download_async(url, config, logger, session):
+    host, port = config.cache_server
+    timeout = aiohttp.ClientTimeout(
+        sock_connect=config.connect_timeout, sock_read=config.read_timeout)
+    for attempt in range(config.download_retries + 1):
+        last_attempt = attempt == config.download_retries
+        try:
+            async with session.get(
+                    f"http://{host}:{port}/",
+                    params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+                    timeout=timeout) as resp:
+                if resp.status not in RETRY_STATUSES or last_attempt:
+                    content = await read_body_async(resp, config.max_page_size)
+                    return to_response(
+                        url, resp.status, content, logger, config.max_page_size)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if last_attempt:
+                return failed_response(url, e, logger)
+        metrics.count("download_retries")
+        await asyncio.sleep(backoff(config, attempt))
+
+async def download_many_async(urls, config, logger=None, concurrency=64):
+    ''' Fetch many urls at once on the running event loop. '''
+    semaphore = asyncio.Semaphore(concurrency)
+    async def fetch(url, session):
+        async with semaphore:
+            return await download_async(url, config, logger, session)
+    if aiohttp is None:
+        return await asyncio.gather(*(fetch(url, None) for url in urls))
+    async with aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        return await asyncio.gather(*(fetch(url, session) for url in urls))
@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import time
+import bisect
+import cProfile
+import pstats
+import threading
+
+from collections import Counter
+from contextlib import contextmanager
+from threading import RLock, Thread, Event
+
+# Upper bounds of the histogram buckets, in seconds and in bytes.
+LATENCY_BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                  1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BOUNDS = tuple(1024 * 4 ** i for i in range(8))
+
+class Histogram(object):
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One more bucket for values above the last bound.
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        ''' (bound, number of values <= bound), ending with ("+Inf", count). '''
+        total = 0
+        buckets = list()
+        for bound, count in zip(self.bounds + ("+Inf",), self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+class Metrics(object):
+    ''' Counters and histograms of the whole crawl. Stages are timed with
+    timer(stage), which records a "<stage>_seconds" histogram. '''
+
+    def __init__(self):
+        self.lock = RLock()
+        self.counters = Counter()
+        self.histograms = dict()
+        self.started = time.time()
+        self.stop_dumping = Event()
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, name, value, bounds=LATENCY_BOUNDS):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(bounds)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f"{stage}_seconds", time.perf_counter() - start)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "uptime_seconds": time.time() - self.started,
+                "counters": dict(self.counters),
+                "histograms": {
+                    name: {
+                        "count": histogram.count,
+                        "sum": histogram.sum,
+                        "buckets": [[str(bound), count] for bound, count in histogram.cumulative()],
+                    } for name, histogram in self.histograms.items()},
+            }
+
+    def to_prometheus(self):
+        lines = list()
+        with self.lock:
+            lines.append("# TYPE crawler_uptime_seconds gauge")
+            lines.append(f"crawler_uptime_seconds {time.time() - self.started:.3f}")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE crawler_{name}_total counter")
+                lines.append(f"crawler_{name}_total {value}")
+            for name, histogram in sorted(self.histograms.items()):
+                lines.append(f"# TYPE crawler_{name} histogram")
+                for bound, count in histogram.cumulative():
+                    lines.append(f'crawler_{name}_bucket{{le="{bound}"}} {count}')
+                lines.append(f"crawler_{name}_sum {histogram.sum}")
+                lines.append(f"crawler_{name}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, filename):
+        ''' Writes the metrics as Prometheus text if filename ends in .prom,
+        as JSON otherwise. '''
+        if filename.endswith(".prom"):
+            data = self.to_prometheus()
+        else:
+            data = json.dumps(self.snapshot(), indent=1)
+        tmp_filename = f"{filename}.tmp"
+        with open(tmp_filename, "w") as file:
+            file.write(data)
+        os.replace(tmp_filename, filename)
+
+    def start_periodic_dump(self, interval, filename):
+        def dump_periodically():
+            while not self.stop_dumping.wait(interval):
+                self.dump(filename)
+        Thread(target=dump_periodically, daemon=True).start()
+
+    def stop_periodic_dump(self, filename):
+        self.stop_dumping.set()
+        self.dump(filename)
+
+metrics = Metrics()
+
+class ThreadsProfiler(object):
+    ''' cProfile for every thread started after start(), merged into one
+    pstats file by stop(). '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.profiles = list()
+
+    def _profile_thread(self, frame, event, arg):
+        # Called on the first event of a new thread, hands it over to its
+        # own cProfile.
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        self.profiles.append(profile)
+        profile.enable()
+
+    def start(self):
+        threading.setprofile(self._profile_thread)
+
+    def stop(self):
+        threading.setprofile(None)
+        if not self.profiles:
+            return
+        stats = pstats.Stats(self.profiles[0])
+        for profile in self.profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(self.filename)
+
+class SamplingProfiler(Thread):
+    ''' Looks at the stack of every thread each interval seconds and counts
+    how often each stack was seen. stop() writes them in collapsed format,
+    one "outer;...;inner count" line per stack, which flamegraph.pl and
+    speedscope read. Costs next to nothing in the sampled threads. '''
+
+    def __init__(self, filename, interval=0.01):
+        self.filename = filename
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = Event()
+        super().__init__(daemon=True)
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = list()
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        with open(self.filename, "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+PROFILERS = {
+    "cprofile": ThreadsProfiler,
+    "sample": SamplingProfiler,
+}
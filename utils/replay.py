@@ -0,0 +1,181 @@
+import os
+import sys
+import mmap
+import cbor
+import pickle
+import random
+import string
+import struct
+import requests
+
+from threading import RLock, Thread
+from multiprocessing import get_context
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# A corpus file is a sequence of records, each a (url length, body length,
+# http status) header, the utf-8 url and the body the cache server sent.
+RECORD_HEADER = struct.Struct("<IIH")
+
+class CorpusWriter(object):
+    ''' Appends cache server responses to a corpus file. '''
+
+    def __init__(self, filename):
+        self.lock = RLock()
+        self.file = open(filename, "ab")
+
+    def record(self, url, status, body):
+        data = url.encode("utf-8", "surrogatepass")
+        body = body or b""
+        with self.lock:
+            self.file.write(RECORD_HEADER.pack(len(data), len(body), status) + data + body)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class Corpus(object):
+    ''' Memory mapped corpus file, indexed by url. A url recorded more than
+    once gets its last response, and a record torn at the end of the file
+    is ignored. '''
+
+    def __init__(self, filename):
+        self.index = dict()
+        self.map = b""
+        if not os.path.getsize(filename):
+            return
+        with open(filename, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        position = 0
+        while position + RECORD_HEADER.size <= len(self.map):
+            url_length, body_length, status = RECORD_HEADER.unpack_from(self.map, position)
+            start = position + RECORD_HEADER.size
+            end = start + url_length + body_length
+            if end > len(self.map):
+                break
+            url = self.map[start:start + url_length].decode("utf-8", "surrogatepass")
+            self.index[url] = (status, start + url_length, body_length)
+            position = end
+
+    def get(self, url):
+        ''' (status, body) recorded for url, None if it was not. '''
+        entry = self.index.get(url)
+        if entry is None:
+            return None
+        status, start, length = entry
+        return status, self.map[start:start + length]
+
+    def __len__(self):
+        return len(self.index)
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, without this every response
+    # waits for a delayed ack.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+        recorded = self.server.corpus.get(url)
+        if recorded is None:
+            status, body = 200, cbor.dumps(
+                {"url": url, "status": 404, "error": f"{url} is not in the corpus."})
+        else:
+            status, body = recorded
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class ReplayServer(ThreadingHTTPServer):
+    ''' Stand-in for the cache server, answers GET /?q=<url>&u=<agent> with
+    what was recorded for url. Urls missing from the corpus get a response
+    with status 404, the way the cache server reports pages it could not
+    fetch. '''
+    daemon_threads = True
+
+    def __init__(self, corpus, address=("127.0.0.1", 0)):
+        self.corpus = corpus
+        super().__init__(address, ReplayHandler)
+
+    def handle_error(self, request, client_address):
+        # The crawler hangs up on responses that are too large.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def serve_corpus(filename, conn):
+    server = ReplayServer(Corpus(filename))
+    conn.send(server.server_address)
+    Thread(target=server.serve_forever, daemon=True).start()
+    # Serve until the parent closes its end of the pipe.
+    try:
+        conn.recv()
+    except EOFError:
+        pass
+    server.shutdown()
+
+def start_replay_server(filename):
+    ''' Serves the corpus in filename from a separate process, so it does
+    not compete with the crawler for the GIL. Returns the process and the
+    (host, port) to use as cache server. Stop it with stop_replay_server. '''
+    context = get_context("spawn")
+    conn, child_conn = context.Pipe()
+    process = context.Process(target=serve_corpus, args=(filename, child_conn), daemon=True)
+    process.start()
+    child_conn.close()
+    cache_server = tuple(conn.recv())
+    process.conn = conn
+    return process, cache_server
+
+def stop_replay_server(process):
+    process.conn.close()
+    process.join()
+
+def cache_server_body(url, content, status=200):
+    ''' What the cache server sends for a page: a cbor dict with the pickled
+    requests.Response. '''
+    response = requests.models.Response()
+    response.url = url
+    response.status_code = status
+    response._content = content
+    return cbor.dumps({"url": url, "status": status, "response": pickle.dumps(response)})
+
+def generate_corpus(filename, pages=2000, hosts=16, links=12, words=400, seed=0):
+    ''' Writes a synthetic corpus of pages spread over subdomains of
+    ics.uci.edu, with Zipf like text, links between the pages, links the
+    filter rejects, near duplicate pages and a robots.txt per host. Returns
+    the seed urls. '''
+    rng = random.Random(seed)
+    vocabulary = [
+        "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 12)))
+        for _ in range(5000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    host_names = [f"host{i}.ics.uci.edu" for i in range(hosts)]
+    urls = [f"https://{host_names[i % hosts]}/page{i}" for i in range(pages)]
+    rejected = ["https://www.example.com/", "https://host0.ics.uci.edu/paper.pdf",
+                "https://host1.ics.uci.edu/events/2020-01-01"]
+    if os.path.exists(filename):
+        os.remove(filename)
+    writer = CorpusWriter(filename)
+    texts = list()
+    for i, url in enumerate(urls):
+        if texts and rng.random() < 0.05:
+            # A near duplicate of an earlier page.
+            text = rng.choice(texts) + " " + rng.choice(vocabulary)
+        else:
+            text = " ".join(rng.choices(vocabulary, weights, k=words))
+            texts.append(text)
+        targets = rng.sample(urls, min(links, pages)) + [rng.choice(rejected)]
+        anchors = "".join(f'<a href="{target}">{rng.choice(vocabulary)}</a>' for target in targets)
+        html = (f"<html><head><title>{i}</title><script>var x = {i};</script></head>"
+                f"<body><p>{text}</p>{anchors}</body></html>")
+        writer.record(url, 200, cache_server_body(url, html.encode("utf-8")))
+    for host in host_names:
+        robots = f"https://{host}/robots.txt"
+        writer.record(robots, 200, cache_server_body(
+            robots, b"User-agent: *\nDisallow: /private\n"))
+    writer.close()
+    return [urls[0]]
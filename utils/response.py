@@ -1,14 +1,84 @@
+import io
 import pickle
 
+from requests.structures import CaseInsensitiveDict
+
+from utils.metrics import metrics
+
 class Response(object):
-    def __init__(self, resp_dict):
+    def __init__(self, resp_dict, max_size=0):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
         try:
             self.raw_response = (
-                pickle.loads(resp_dict["response"])
+                load_raw_response(resp_dict["response"], max_size)
                 if "response" in resp_dict else
                 None)
         except TypeError:
             self.raw_response = None
+
+class RawResponse(object):
+    ''' What the crawler needs of the requests.Response pickled by the cache
+    server: content, url, status_code and encoding. Headers are only built
+    when asked for, and the rest of the state is dropped. '''
+
+    def __setstate__(self, state):
+        self.content = state.get("_content") or b""
+        self.url = state.get("url")
+        self.status_code = state.get("status_code")
+        self.encoding = state.get("encoding")
+        self.reason = state.get("reason")
+        self._headers = state.get("headers")
+
+    @property
+    def headers(self):
+        if isinstance(self._headers, Placeholder):
+            store = self._headers.state.get("_store", {})
+            self._headers = CaseInsensitiveDict(dict(store.values()))
+        return self._headers
+
+    @property
+    def ok(self):
+        return not (self.status_code and 400 <= self.status_code < 600)
+
+    def __bool__(self):
+        # Same truth value as a requests.Response.
+        return self.ok
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", "replace")
+
+class Placeholder(object):
+    ''' Stands in for any other class in the pickle (headers, cookies, the
+    prepared request), keeping its state without building it. '''
+
+    def __setstate__(self, state):
+        self.state = state
+
+class LeanUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if module == "requests.models" and name == "Response":
+            return RawResponse
+        if module.split(".")[0] in ("requests", "http", "urllib3"):
+            return Placeholder
+        return super().find_class(module, name)
+
+def load_raw_response(data, max_size=0):
+    ''' Unpickles the cache server's requests.Response as a RawResponse.
+    Content longer than max_size bytes (if not 0) is cut to max_size. '''
+    try:
+        # BytesIO shares the buffer of data instead of copying it.
+        raw_response = LeanUnpickler(io.BytesIO(data)).load()
+    except (pickle.UnpicklingError, AttributeError, TypeError, ValueError):
+        # Something the lean classes cannot stand in for, unpickle it whole.
+        raw_response = pickle.loads(data)
+        if max_size and raw_response is not None and len(raw_response.content) > max_size:
+            metrics.count("pages_truncated")
+            raw_response._content = raw_response.content[:max_size]
+        return raw_response
+    if max_size and len(raw_response.content) > max_size:
+        metrics.count("pages_truncated")
+        raw_response.content = raw_response.content[:max_size]
+    return raw_response
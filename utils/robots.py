@@ -0,0 +1,118 @@
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from threading import RLock
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+from utils import get_logger
+from utils.download import download
+
+class RobotsManager(object):
+    ''' Shared robots.txt rules for every host the crawler sees.
+
+    robots.txt is fetched through the cache server on a small background
+    pool, at most once per host at a time. Parsed rules are kept in an LRU
+    of max_hosts entries for ttl seconds; hosts whose robots.txt could not
+    be fetched are treated as having none for failure_ttl seconds before
+    being retried. '''
+
+    def __init__(self, config, ttl=24 * 3600, failure_ttl=600, max_hosts=4096,
+                 fetch_threads=4):
+        self.logger = get_logger("ROBOTS")
+        self.config = config
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.max_hosts = max_hosts
+        self.lock = RLock()
+        # root url -> (RobotFileParser, expiry time), least recently used first.
+        self.rules = OrderedDict()
+        # root url -> Future of the fetch in progress.
+        self.fetching = dict()
+        self.pool = ThreadPoolExecutor(
+            max_workers=fetch_threads, thread_name_prefix="Robots")
+
+    @staticmethod
+    def root_url(url):
+        parsed = urlparse(url)
+        return f"{parsed.scheme}://{parsed.netloc}"
+
+    def _cached(self, root):
+        with self.lock:
+            if root not in self.rules:
+                return None
+            rp, expires = self.rules[root]
+            if expires < time.time():
+                del self.rules[root]
+                return None
+            self.rules.move_to_end(root)
+            return rp
+
+    def prefetch(self, url):
+        ''' Start fetching the robots.txt of the url's host unless it is
+        already cached or being fetched. Returns the rules if cached, else
+        the Future of the fetch. '''
+        root = self.root_url(url)
+        with self.lock:
+            rp = self._cached(root)
+            if rp is not None:
+                return rp
+            if root not in self.fetching:
+                self.fetching[root] = self.pool.submit(self._fetch, root)
+            return self.fetching[root]
+
+    def _fetch(self, root):
+        ttl = self.ttl
+        rp = RobotFileParser(f"{root}/robots.txt")
+        try:
+            resp = download(f"{root}/robots.txt", self.config, self.logger)
+            if resp.status == 200:
+                content = resp.raw_response.content if resp.raw_response else b""
+                rp.parse(content.decode("utf-8", "replace").splitlines())
+            elif resp.status in (401, 403):
+                rp.disallow_all = True
+            elif 400 <= resp.status < 500:
+                rp.allow_all = True
+            else:
+                # Server or cache errors, try again sooner.
+                rp.allow_all = True
+                ttl = self.failure_ttl
+        except Exception as e:
+            self.logger.error(f"Could not fetch {root}/robots.txt: {e}")
+            rp.allow_all = True
+            ttl = self.failure_ttl
+        with self.lock:
+            self.rules[root] = (rp, time.time() + ttl)
+            self.rules.move_to_end(root)
+            while len(self.rules) > self.max_hosts:
+                self.rules.popitem(last=False)
+            del self.fetching[root]
+        return rp
+
+    def can_fetch(self, url, timeout=None):
+        ''' With no timeout this never blocks: urls of hosts whose rules are
+        not known yet are allowed, and the rules are fetched in the
+        background. Otherwise waits up to timeout seconds for the rules. '''
+        rules = self.prefetch(url)
+        if not isinstance(rules, RobotFileParser):
+            if timeout is None:
+                return True
+            try:
+                rules = rules.result(timeout)
+            except TimeoutError:
+                return True
+        return rules.can_fetch(self.config.user_agent, url)
+
+    def crawl_delay(self, url):
+        ''' Crawl-delay of the url's host if its rules are known. '''
+        rp = self._cached(self.root_url(url))
+        if rp is None:
+            return None
+        delay = rp.crawl_delay(self.config.user_agent)
+        return float(delay) if delay is not None else None
+
+    def close(self):
+        ''' Drops the fetches that have not started, so exiting does not
+        wait for robots.txt files nobody will use. '''
+        self.pool.shutdown(wait=False, cancel_futures=True)